@@ -0,0 +1,114 @@
+# Marketplace model package / algorithm ARNs of every 7Park product by region.
+#
+# The ARNs live in one data file, `arns.json` ({product: {region: arn}}),
+# which is loaded once on import and indexed by (product, region) and by
+# region. Lookups are dict hits; an unsupported product or region raises an
+# error naming what is supported. The per-product `src/*_arns.py` providers
+# used by the notebooks are thin wrappers over `registry`; they run this file
+# by path, so it must keep to the standard library and absolute imports.
+#
+# Examples, run from the aws_marketplace directory:
+#   python -m marketplace_tools.arn_registry drug_ner us-east-1
+#   python -m marketplace_tools.arn_registry --region us-east-2
+
+import argparse
+import json
+import os
+
+ARNS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'arns.json')
+
+
+class UnsupportedRegionError(KeyError):
+
+    def __init__(self, product, region, supported):
+        super().__init__(product, region)
+        self.product = product
+        self.region = region
+        self.supported = supported
+
+    def __str__(self):
+        return '%s is not available in region %r; supported regions: %s' % (
+            self.product, self.region, ', '.join(self.supported))
+
+
+class UnknownProductError(KeyError):
+
+    def __init__(self, product, supported):
+        super().__init__(product)
+        self.product = product
+        self.supported = supported
+
+    def __str__(self):
+        return 'Unknown product %r; known products: %s' % (self.product, ', '.join(self.supported))
+
+
+class ArnRegistry:
+    """ARNs indexed by (product, region), with per-region bulk lookups."""
+
+    def __init__(self, arns):
+        self._by_product = {product: dict(regions) for product, regions in arns.items()}
+        self._index = {(product, region): arn
+                       for product, regions in self._by_product.items() for region, arn in regions.items()}
+        self._by_region = {}
+        for (product, region), arn in self._index.items():
+            self._by_region.setdefault(region, {})[product] = arn
+        self.products = tuple(sorted(self._by_product))
+        self.regions = tuple(sorted(self._by_region))
+
+    @classmethod
+    def from_file(cls, path=ARNS_FILE):
+        with open(path, encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    def supported_regions(self, product):
+        try:
+            return tuple(sorted(self._by_product[product]))
+        except KeyError:
+            raise UnknownProductError(product, self.products) from None
+
+    def arn(self, product, region):
+        try:
+            return self._index[product, region]
+        except KeyError:
+            raise UnsupportedRegionError(product, region, self.supported_regions(product)) from None
+
+    def arns_for_region(self, region, products=None):
+        """Return {product: arn} for `products` (default: every product available in `region`).
+
+        Naming a product that is unknown or not available in the region raises.
+        """
+        if products is None:
+            return dict(self._by_region.get(region, {}))
+        return {product: self.arn(product, region) for product in products}
+
+    def resolve(self, products, regions):
+        """Return {(product, region): arn} for every combination of `products` and `regions`."""
+        return {(product, region): self.arn(product, region) for region in regions for product in products}
+
+
+registry = ArnRegistry.from_file()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Look up 7Park AWS Marketplace ARNs.')
+    parser.add_argument('product', nargs='?', help='product, e.g. drug_ner; omit with --region to list all')
+    parser.add_argument('region', nargs='?')
+    parser.add_argument('--region', dest='bulk_region', help='print the ARN of every product in this region')
+    args = parser.parse_args()
+
+    try:
+        if args.bulk_region:
+            for product, arn in sorted(registry.arns_for_region(args.bulk_region).items()):
+                print('%s\t%s' % (product, arn))
+        elif args.product and args.region:
+            print(registry.arn(args.product, args.region))
+        elif args.product:
+            print('\n'.join(registry.supported_regions(args.product)))
+        else:
+            print('\n'.join(registry.products))
+    except KeyError as e:
+        parser.exit(1, '%s\n' % e)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,232 @@
+# Throughput and latency benchmark for the NER and stopword endpoints.
+#
+# Replays the products' `samples.jl` corpora (or `--records` records sampled
+# from them) against a target, for every combination of client concurrency
+# and records per request, and reports records/sec with p50/p95/p99 request
+# latency as JSON and CSV. The target is a deployed endpoint
+# (`sagemaker:<endpoint name>`), a container-style `/invocations` URL, or by
+# default a local stub endpoint with injected latency, so the harness runs
+# offline.
+#
+# With `--target-throughput`, the fastest configuration (within `--max-p99`,
+# if given) is used to recommend an instance count: the benchmark measures
+# one instance, and instances are added until the target is met at
+# `--utilisation` of each instance's measured throughput.
+#
+# Examples, run from the aws_marketplace directory:
+#   python -m marketplace_tools.endpoint_benchmark --kind ner --records 5000 \
+#       --concurrency 1 4 16 --batch-size 1 16 64 --target-throughput 2000 --json ner.json --csv ner.csv
+#   python -m marketplace_tools.endpoint_benchmark --kind stopword --target sagemaker:stopword-endpoint
+
+import argparse
+import csv
+import glob
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from marketplace_tools import sagemaker_jsonlines
+from marketplace_tools.micro_batcher import HttpTransport, LatencyRecorder, SageMakerEndpointTransport
+
+MARKETPLACE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CORPORA = {
+    'ner': os.path.join(MARKETPLACE_DIR, 'using_model_packages', '*', 'data', 'samples.jl'),
+    'stopword': os.path.join(MARKETPLACE_DIR, 'using_algorithm', 'stopword_algorithm', 'data',
+                             'transform_data_example', 'samples.jl'),
+}
+STUB_STOPWORDS = ('a', 'an', 'and', 'are', 'be', 'in', 'is', 'it', 'of', 'the', 'to', 'was', 'will', 'you')
+CSV_FIELDS = ('concurrency', 'batch_size', 'requests', 'records', 'errors', 'seconds', 'records_per_second',
+              'p50_ms', 'p95_ms', 'p99_ms')
+
+
+def load_corpus(kind, paths=None):
+    paths = paths or sorted(glob.glob(CORPORA[kind]))
+    records = [record for path in paths for record in sagemaker_jsonlines.iter_records(path)]
+    if not records:
+        raise ValueError('No records found in %s' % ', '.join(paths))
+    return records
+
+
+def scaled_records(records, count=None, seed=0):
+    """Return `count` records sampled from `records` (all of them, in order, if count is None)."""
+    if count is None:
+        return list(records)
+    rng = random.Random(seed)
+    return [rng.choice(records) for _ in range(count)]
+
+
+def encode_requests(records, batch_size):
+    """Split records into JSON-lines request bodies; return [(body, record count)]."""
+    bodies = []
+    for start in range(0, len(records), batch_size):
+        batch = records[start:start + batch_size]
+        lines = []
+        for i, record in enumerate(batch):
+            if 'instance' in record:
+                # The NER containers key their output on `id`, which must be unique within a request.
+                record = dict(record, id=i)
+            lines.append(sagemaker_jsonlines.dumps(record) + '\n')
+        bodies.append((''.join(lines).encode('utf-8'), len(batch)))
+    return bodies
+
+
+def run_load(invoke, bodies, concurrency):
+    """Send every body with `concurrency` client threads; return a result row."""
+    latency = LatencyRecorder(window=len(bodies))
+    counts = {'records': 0, 'errors': 0}
+    lock = threading.Lock()
+
+    def send(item):
+        body, records = item
+        start = time.perf_counter()
+        try:
+            response = invoke(body)
+            ok = sum(1 for line in response.splitlines() if line.strip()) == records
+        except Exception:
+            ok = False
+        seconds = time.perf_counter() - start
+        with lock:
+            if ok:
+                counts['records'] += records
+                latency.add(seconds)
+            else:
+                counts['errors'] += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(send, bodies))
+    elapsed = time.perf_counter() - start
+    p50, p95, p99 = latency.percentiles(0.5, 0.95, 0.99)
+    return {
+        'concurrency': concurrency,
+        'requests': len(bodies),
+        'records': counts['records'],
+        'errors': counts['errors'],
+        'seconds': round(elapsed, 4),
+        'records_per_second': round(counts['records'] / elapsed, 1),
+        'p50_ms': None if p50 is None else round(p50 * 1000, 2),
+        'p95_ms': None if p95 is None else round(p95 * 1000, 2),
+        'p99_ms': None if p99 is None else round(p99 * 1000, 2),
+    }
+
+
+def sweep(invoke, records, concurrencies, batch_sizes, warmup_requests=2):
+    results = []
+    for batch_size in batch_sizes:
+        bodies = encode_requests(records, batch_size)
+        for body, _ in bodies[:warmup_requests]:
+            invoke(body)
+        for concurrency in concurrencies:
+            row = run_load(invoke, bodies, concurrency)
+            row['batch_size'] = batch_size
+            results.append(row)
+    return results
+
+
+def recommend(results, target_throughput, max_p99_ms=None, utilisation=0.7):
+    """Pick the fastest error-free configuration within the p99 bound and size the fleet for the target."""
+    candidates = [r for r in results if not r['errors'] and r['records'] and
+                  (max_p99_ms is None or r['p99_ms'] <= max_p99_ms)]
+    if not candidates:
+        return None
+    best = max(candidates, key=lambda r: r['records_per_second'])
+    per_instance = best['records_per_second'] * utilisation
+    return {
+        'target_records_per_second': target_throughput,
+        'max_p99_ms': max_p99_ms,
+        'utilisation': utilisation,
+        'concurrency': best['concurrency'],
+        'batch_size': best['batch_size'],
+        'measured_records_per_second': best['records_per_second'],
+        'p99_ms': best['p99_ms'],
+        'instance_count': max(1, math.ceil(target_throughput / per_instance)),
+    }
+
+
+def write_csv(results, path):
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, CSV_FIELDS)
+        writer.writeheader()
+        for row in results:
+            writer.writerow({field: row[field] for field in CSV_FIELDS})
+
+
+def stub_endpoint(kind, latency, per_record_latency, workers):
+    from marketplace_tools.ner_models import GazetteerModel
+    from marketplace_tools.stub_endpoints import StubNerEndpoint, StubStopwordEndpoint
+
+    if kind == 'ner':
+        outputs = [path + '.out' for path in sorted(glob.glob(CORPORA['ner']))]
+        return StubNerEndpoint(GazetteerModel(paths=outputs), latency, per_record_latency, workers)
+    return StubStopwordEndpoint(STUB_STOPWORDS, latency, per_record_latency, workers)
+
+
+def make_invoker(target):
+    """Return a callable sending a raw JSON-lines body to the target and returning the response body."""
+    if target.startswith('sagemaker:'):
+        return SageMakerEndpointTransport(target[len('sagemaker:'):]).invoke
+    return HttpTransport(target).invoke
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark NER / stopword endpoints over a concurrency x batch '
+                                                 'size grid.')
+    parser.add_argument('--kind', choices=sorted(CORPORA), default='ner', help='request and response shape')
+    parser.add_argument('--target', help='sagemaker:<endpoint name> or an /invocations URL; default: a local stub')
+    parser.add_argument('--corpus', nargs='+', help='JSON-lines input files; default: the samples.jl of --kind')
+    parser.add_argument('--records', type=int, help='records per run, sampled from the corpus; default: all')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--batch-size', type=int, nargs='+', default=[1, 16, 64], help='records per request')
+    parser.add_argument('--stub-latency', type=float, default=0.02, help='stub seconds per request')
+    parser.add_argument('--stub-per-record-latency', type=float, default=0.001, help='stub seconds per record')
+    parser.add_argument('--stub-workers', type=int, default=4, help='requests the stub processes at once')
+    parser.add_argument('--target-throughput', type=float, help='records/sec the fleet must sustain')
+    parser.add_argument('--max-p99', type=float, help='p99 request latency bound in ms for the recommendation')
+    parser.add_argument('--utilisation', type=float, default=0.7, help='planned load per instance, 0-1')
+    parser.add_argument('--json', help='path of the JSON report')
+    parser.add_argument('--csv', help='path of the CSV report')
+    args = parser.parse_args()
+    if not 0 < args.utilisation <= 1:
+        parser.error('--utilisation must be in (0, 1]')
+
+    records = scaled_records(load_corpus(args.kind, args.corpus), args.records)
+    if args.target:
+        results = sweep(make_invoker(args.target), records, args.concurrency, args.batch_size)
+    else:
+        with stub_endpoint(args.kind, args.stub_latency, args.stub_per_record_latency,
+                           args.stub_workers) as endpoint:
+            results = sweep(make_invoker(endpoint.url), records, args.concurrency, args.batch_size)
+
+    print('%11s %10s %8s %7s %12s %9s %9s %9s' % ('concurrency', 'batch size', 'records', 'errors', 'records/s',
+                                                 'p50 ms', 'p95 ms', 'p99 ms'))
+    for r in results:
+        print('%11d %10d %8d %7d %12.1f %9s %9s %9s' % (r['concurrency'], r['batch_size'], r['records'],
+                                                        r['errors'], r['records_per_second'], r['p50_ms'],
+                                                        r['p95_ms'], r['p99_ms']))
+
+    report = {'kind': args.kind, 'target': args.target or 'stub', 'results': results}
+    if args.target_throughput:
+        recommendation = recommend(results, args.target_throughput, args.max_p99, args.utilisation)
+        report['recommendation'] = recommendation
+        if recommendation:
+            print('\n%d instance(s) for %.0f records/s: concurrency %d, batch size %d, %.1f records/s and '
+                  'p99 %s ms per instance at %d%% utilisation' % (
+                      recommendation['instance_count'], args.target_throughput, recommendation['concurrency'],
+                      recommendation['batch_size'], recommendation['measured_records_per_second'],
+                      recommendation['p99_ms'], args.utilisation * 100))
+        else:
+            print('\nNo error-free configuration met the p99 bound; no recommendation', file=sys.stderr)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.csv:
+        write_csv(results, args.csv)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+# Local batch inference with the same JSON-lines contract as the NER model
+# packages' Batch Transform jobs (`join_source="Input"`, `split_type="Line"`):
+#
+#   in:  {"id": 0, "instance": "..."}
+#   out: {"SageMakerOutput": {"ner": [{"end_pos", "key", "start_pos", "type"}, ...]}, "id": 0, "instance": "..."}
+#
+# The input file is streamed in chunks which are fanned out to a process pool;
+# results are written back in input order, with a bounded number of chunks
+# in flight. The model is any callable named as `module:attribute` (see
+# ner_models.py); classes are instantiated once per worker with --model-kwargs.
+#
+# Example, run from the aws_marketplace directory, reproducing a checked-in output:
+#   python -m marketplace_tools.local_transform \
+#       using_model_packages/drug_ner/data/samples.jl /tmp/samples.jl.out \
+#       --model marketplace_tools.ner_models:ReplayModel \
+#       --model-kwargs '{"path": "using_model_packages/drug_ner/data/samples.jl.out"}' \
+#       --expected using_model_packages/drug_ner/data/samples.jl.out
+
+import argparse
+import importlib
+import json
+import os
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice, zip_longest
+
+from marketplace_tools import sagemaker_jsonlines, tracing
+
+_model = None
+
+
+def load_model(spec, kwargs=None):
+    module_name, _, attribute = spec.partition(':')
+    model = getattr(importlib.import_module(module_name), attribute)
+    if isinstance(model, type):
+        model = model(**(kwargs or {}))
+    return model
+
+
+def _init_worker(spec, kwargs):
+    global _model
+    _model = load_model(spec, kwargs)
+
+
+def transform_lines(model, lines):
+    with tracing.span('local_transform.parse', records=len(lines)):
+        records = [json.loads(line) for line in lines]
+    with tracing.span('local_transform.predict', records=len(records)):
+        spans = model([r['instance'] for r in records])
+    with tracing.span('local_transform.serialize', records=len(records)):
+        return [sagemaker_jsonlines.dumps(sagemaker_jsonlines.ner_output(r, s)) for r, s in zip(records, spans)]
+
+
+def _transform_chunk(lines):
+    return transform_lines(_model, lines)
+
+
+def iter_chunks(lines, chunk_size):
+    lines = iter(lines)
+    while True:
+        chunk = list(islice(lines, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def iter_transformed(lines, model_spec, model_kwargs=None, chunk_size=1000, workers=None, max_pending=None):
+    """Yield output lines for the input lines, in input order."""
+    chunks = iter_chunks(lines, chunk_size)
+    if workers == 0:
+        model = load_model(model_spec, model_kwargs)
+        for chunk in chunks:
+            yield from transform_lines(model, chunk)
+        return
+
+    workers = workers or os.cpu_count()
+    max_pending = max_pending or 2 * workers
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(model_spec, model_kwargs)) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.submit(_transform_chunk, chunk))
+            if len(pending) >= max_pending:
+                with tracing.span('local_transform.wait'):
+                    output = pending.popleft().result()
+                yield from output
+        while pending:
+            with tracing.span('local_transform.wait'):
+                output = pending.popleft().result()
+            yield from output
+
+
+def run_local_transform(input_path, output_path, model_spec, model_kwargs=None, chunk_size=1000, workers=None):
+    count = 0
+    with open(output_path, 'w', encoding='utf-8') as out:
+        for line in iter_transformed(sagemaker_jsonlines.iter_lines(input_path), model_spec, model_kwargs,
+                                     chunk_size, workers):
+            out.write(line)
+            out.write('\n')
+            count += 1
+    return count
+
+
+def first_difference(path, expected_path):
+    with open(path, encoding='utf-8') as actual, open(expected_path, encoding='utf-8') as expected:
+        for number, (a, e) in enumerate(zip_longest(actual, expected, fillvalue='<end of file>\n'), 1):
+            if a != e:
+                return number, a, e
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run NER batch inference locally over a JSON-lines file.')
+    parser.add_argument('input', help='JSON-lines file of {"id", "instance"} records')
+    parser.add_argument('output', help='path of the .jl.out file to write')
+    parser.add_argument('--model', required=True, help='model callable or class as module:attribute')
+    parser.add_argument('--model-kwargs', type=json.loads, default=None, help='JSON object passed to a model class')
+    parser.add_argument('--chunk-size', type=int, default=1000, help='records per chunk sent to a worker')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes; 0 runs in this process')
+    parser.add_argument('--expected', help='golden .jl.out file the output must match byte-for-byte')
+    args = parser.parse_args()
+
+    count = run_local_transform(args.input, args.output, args.model, args.model_kwargs, args.chunk_size,
+                                args.workers)
+    print('Wrote %d records to %s' % (count, args.output))
+    if args.expected:
+        difference = first_difference(args.output, args.expected)
+        if difference:
+            print('Output differs from %s at line %d:\n  got:      %s  expected: %s' %
+                  ((args.expected,) + difference))
+            sys.exit(1)
+        print('Output matches %s' % args.expected)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,249 @@
+# Client-side micro-batching for the real-time NER endpoints.
+#
+# Instead of one `predictor.predict(json.dumps(sample))` round trip per
+# instance, callers submit instances to a MicroBatcher from any thread and get
+# a future back. A background thread groups pending instances into one
+# JSON-lines request once `max_batch_size` is reached or the oldest instance
+# has waited `max_latency` seconds, and resolves each future with that
+# instance's `ner` spans.
+#
+# Example against a local stub endpoint, run from the aws_marketplace directory:
+#   python -m marketplace_tools.micro_batcher --requests 2000 --callers 32
+
+import argparse
+import json
+import queue
+import threading
+import time
+import urllib.request
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from marketplace_tools import sagemaker_jsonlines, tracing
+
+_STOP = object()
+
+
+def encode_batch(instances):
+    return ''.join(sagemaker_jsonlines.dumps({'id': i, 'instance': instance}) + '\n'
+                   for i, instance in enumerate(instances)).encode('utf-8')
+
+
+def decode_batch(body, count):
+    # A deployed endpoint answers each input line with a bare {"ner": [...]},
+    # matched to its instance by position; the stub endpoints answer in the
+    # Batch Transform shape, {"id", "SageMakerOutput": {"ner"}, ...}, matched by id.
+    results = [None] * count
+    lines = [line for line in body.splitlines() if line.strip()]
+    if len(lines) > count:
+        raise ValueError('Endpoint response has %d records for %d instances' % (len(lines), count))
+    for position, line in enumerate(lines):
+        record = json.loads(line)
+        if 'SageMakerOutput' in record:
+            results[record.get('id', position)] = record['SageMakerOutput']['ner']
+        else:
+            results[position] = record['ner']
+    missing = [i for i, r in enumerate(results) if r is None]
+    if missing:
+        raise ValueError('Endpoint response has no output for %d of %d records' % (len(missing), count))
+    return results
+
+
+class SageMakerEndpointTransport:
+    """Send a batch to a deployed endpoint through the sagemaker-runtime API."""
+
+    def __init__(self, endpoint_name, runtime_client=None):
+        if runtime_client is None:
+            import boto3
+            runtime_client = boto3.client('sagemaker-runtime')
+        self.endpoint_name = endpoint_name
+        self.runtime_client = runtime_client
+
+    def invoke(self, body):
+        """Send a raw JSON-lines request body; return the raw response body."""
+        response = self.runtime_client.invoke_endpoint(EndpointName=self.endpoint_name,
+                                                       ContentType='application/jsonlines',
+                                                       Accept='application/jsonlines',
+                                                       Body=body)
+        return response['Body'].read()
+
+    def __call__(self, instances):
+        return decode_batch(self.invoke(encode_batch(instances)).decode('utf-8'), len(instances))
+
+
+class HttpTransport:
+    """Send a batch to a container-style `/invocations` URL, e.g. a stub endpoint."""
+
+    def __init__(self, url, timeout=60):
+        self.url = url
+        self.timeout = timeout
+
+    def invoke(self, body):
+        """Send a raw JSON-lines request body; return the raw response body."""
+        request = urllib.request.Request(self.url, data=body, method='POST',
+                                         headers={'Content-Type': 'application/jsonlines',
+                                                  'Accept': 'application/jsonlines'})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return response.read()
+
+    def __call__(self, instances):
+        return decode_batch(self.invoke(encode_batch(instances)).decode('utf-8'), len(instances))
+
+
+class LatencyRecorder:
+
+    def __init__(self, window=10000):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentiles(self, *quantiles):
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return [None] * len(quantiles)
+        return [samples[min(len(samples) - 1, int(q * len(samples)))] for q in quantiles]
+
+
+class MicroBatcher:
+
+    def __init__(self, transport, max_batch_size=64, max_latency=0.005, max_in_flight=4, latency_window=10000):
+        self.transport = transport
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self.latency = LatencyRecorder(latency_window)
+        self.batches = 0
+        self.records = 0
+        self.errors = 0
+        self._counter_lock = threading.Lock()
+        self._queue = queue.Queue()
+        # Guards `_closed`, so no instance is queued behind the stop marker.
+        self._submit_lock = threading.Lock()
+        self._closed = False
+        # Free slots for batches in flight; while all are taken, new instances
+        # keep queueing and go out together in the next batch.
+        self._slots = threading.Semaphore(max_in_flight)
+        self._executor = ThreadPoolExecutor(max_in_flight, thread_name_prefix='micro-batcher')
+        self._thread = threading.Thread(target=self._run, name='micro-batcher-flush', daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        with self._submit_lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(_STOP)
+        self._thread.join()
+        self._executor.shutdown(wait=True)
+
+    def submit(self, instance):
+        future = Future()
+        with self._submit_lock:
+            if self._closed:
+                raise RuntimeError('MicroBatcher is closed')
+            self._queue.put((instance, future, time.perf_counter()))
+        return future
+
+    def predict(self, instance, timeout=None):
+        return self.submit(instance).result(timeout)
+
+    def metrics(self):
+        p50, p99 = self.latency.percentiles(0.5, 0.99)
+        return {
+            'queue_depth': self._queue.qsize(),
+            'batches': self.batches,
+            'records': self.records,
+            'errors': self.errors,
+            'mean_batch_size': self.records / self.batches if self.batches else 0.0,
+            'latency_p50': p50,
+            'latency_p99': p99,
+        }
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            self._slots.acquire()
+            batch = [item]
+            deadline = item[2] + self.max_latency
+            while len(batch) < self.max_batch_size:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.perf_counter()))
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            # Claim the futures; callers can no longer cancel them, and ones already cancelled are dropped.
+            batch = [item for item in batch if item[1].set_running_or_notify_cancel()]
+            if not batch:
+                self._slots.release()
+                continue
+            self._executor.submit(self._send, batch)
+
+    def _send(self, batch):
+        try:
+            with tracing.span('micro_batcher.batch', records=len(batch)):
+                results = self.transport([instance for instance, _, _ in batch])
+            if len(results) != len(batch):
+                raise ValueError('Transport returned %d results for %d instances' % (len(results), len(batch)))
+        except Exception as e:
+            with self._counter_lock:
+                self.errors += 1
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+        finally:
+            self._slots.release()
+        now = time.perf_counter()
+        with self._counter_lock:
+            self.batches += 1
+            self.records += len(batch)
+        for (_, future, submitted), spans in zip(batch, results):
+            self.latency.add(now - submitted)
+            future.set_result(spans)
+
+
+def main():
+    from marketplace_tools.ner_models import GazetteerModel
+    from marketplace_tools.stub_endpoints import StubNerEndpoint
+
+    parser = argparse.ArgumentParser(description='Compare one-request-per-instance and micro-batched calls '
+                                                 'against a local stub NER endpoint.')
+    parser.add_argument('--requests', type=int, default=2000, help='instances to send')
+    parser.add_argument('--callers', type=int, default=32, help='concurrent calling threads')
+    parser.add_argument('--latency', type=float, default=0.01, help='stub latency per request, seconds')
+    parser.add_argument('--max-batch-size', type=int, default=64)
+    parser.add_argument('--max-latency', type=float, default=0.005, help='max seconds an instance waits to be sent')
+    args = parser.parse_args()
+
+    model = GazetteerModel({'ipilimumab': 'NE_DRUG', 'OTEZLA': 'NE_DRUG'})
+    instances = ['Patient %d received ipilimumab, then OTEZLA.' % i for i in range(args.requests)]
+    with StubNerEndpoint(model, latency=args.latency) as endpoint:
+        transport = HttpTransport(endpoint.url)
+        for name, batch_size in (('one instance per request', 1), ('micro-batched', args.max_batch_size)):
+            with MicroBatcher(transport, batch_size, args.max_latency, max_in_flight=args.callers) as batcher:
+                start = time.perf_counter()
+                with ThreadPoolExecutor(args.callers) as callers:
+                    list(callers.map(batcher.predict, instances))
+                elapsed = time.perf_counter() - start
+                m = batcher.metrics()
+            print('%-26s %8.1f req/s  batches %5d  mean batch %5.1f  p50 %6.1f ms  p99 %6.1f ms' %
+                  (name, args.requests / elapsed, m['batches'], m['mean_batch_size'],
+                   m['latency_p50'] * 1000, m['latency_p99'] * 1000))
+
+
+if __name__ == '__main__':
+    main()
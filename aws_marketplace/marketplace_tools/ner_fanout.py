@@ -0,0 +1,195 @@
+# Run several NER models over one corpus in a single pass.
+#
+# The input JSON-lines file is read once, in chunks; every chunk is sent to
+# all backends at the same time and, once each has answered, written out as
+# one merged record per input record with the spans namespaced by backend:
+#
+#   in:  {"id": 0, "instance": "..."}
+#   out: {"id": 0, "instance": "...", "ner": {"drug_ner": [...], "job_title_ner": [...]}}
+#
+# A backend is anything taking a list of instances and returning their spans:
+# a deployed endpoint (`sagemaker:<endpoint name>`), a container-style URL
+# (`http://host:port/invocations`, e.g. a stub endpoint) or a local model
+# (`module:attribute`, see ner_models.py), run in its own worker process.
+# Output is written in input order, with a bounded number of chunks in flight.
+#
+# For Batch Transform, upload the input once and point every model's
+# transformer at the same S3 prefix; `merge` then joins their `.out` files
+# (local or s3://) into the same merged records.
+#
+# Examples, run from the aws_marketplace directory:
+#   python -m marketplace_tools.ner_fanout run corpus.jl corpus.jl.out \
+#       --backend drug_ner=sagemaker:drug-ner-endpoint \
+#       --backend job_title_ner=http://127.0.0.1:8080/invocations
+#   python -m marketplace_tools.ner_fanout merge corpus.jl.out \
+#       drug_ner=s3://bucket/drug/corpus.jl.out job_title_ner=s3://bucket/job_title/corpus.jl.out
+
+import argparse
+import json
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from marketplace_tools import sagemaker_jsonlines, tracing
+from marketplace_tools.local_transform import iter_chunks, load_model
+from marketplace_tools.micro_batcher import HttpTransport, SageMakerEndpointTransport
+from marketplace_tools.shards import storage_for
+
+_model = None
+
+
+def _init_worker(spec, kwargs):
+    global _model
+    _model = load_model(spec, kwargs)
+
+
+def _predict(instances):
+    return _model(instances)
+
+
+class ProcessModel:
+    """Run a local `module:attribute` model in a worker process of its own."""
+
+    def __init__(self, spec, kwargs=None, workers=1):
+        self._pool = ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(spec, kwargs))
+
+    def __call__(self, instances):
+        return self._pool.submit(_predict, instances).result()
+
+    def close(self):
+        self._pool.shutdown(wait=True)
+
+
+def make_backend(spec, kwargs=None):
+    if spec.startswith('sagemaker:'):
+        return SageMakerEndpointTransport(spec[len('sagemaker:'):])
+    if spec.startswith(('http://', 'https://')):
+        return HttpTransport(spec)
+    return ProcessModel(spec, kwargs)
+
+
+def merged_output(record, spans_by_backend, ner_only=False):
+    output = {'id': record.get('id')} if ner_only else dict(record)
+    output['ner'] = spans_by_backend
+    return output
+
+
+def _call_backend(name, backend, instances):
+    with tracing.span('ner_fanout.backend', backend=name, records=len(instances)):
+        return backend(instances)
+
+
+def iter_fanned_out(lines, backends, chunk_size=100, max_pending=4, ner_only=False):
+    """Yield merged output lines for the input lines, in input order.
+
+    `backends` maps a name to a callable taking a list of instances. Every
+    chunk is sent to all backends concurrently, and up to `max_pending`
+    chunks are in flight at once.
+    """
+    names = list(backends)
+    with ThreadPoolExecutor(len(names) * max_pending, thread_name_prefix='ner-fanout') as pool:
+        pending = deque()
+
+        def finish(records, futures):
+            with tracing.span('ner_fanout.wait', records=len(records)):
+                spans = {name: futures[name].result() for name in names}
+            for i, record in enumerate(records):
+                yield sagemaker_jsonlines.dumps(merged_output(record, {name: spans[name][i] for name in names},
+                                                              ner_only))
+
+        for chunk in iter_chunks(lines, chunk_size):
+            records = [json.loads(line) for line in chunk]
+            instances = [r['instance'] for r in records]
+            pending.append((records, {name: pool.submit(_call_backend, name, backends[name], instances)
+                                      for name in names}))
+            if len(pending) >= max_pending:
+                yield from finish(*pending.popleft())
+        while pending:
+            yield from finish(*pending.popleft())
+
+
+def run_fanout(input_path, output_path, backends, chunk_size=100, max_pending=4, ner_only=False):
+    count = 0
+    with open(output_path, 'w', encoding='utf-8') as out:
+        for line in iter_fanned_out(sagemaker_jsonlines.iter_lines(input_path), backends, chunk_size, max_pending,
+                                    ner_only):
+            out.write(line)
+            out.write('\n')
+            count += 1
+    return count
+
+
+def merge_outputs(output_paths, output_path, ner_only=False):
+    """Join per-model `.jl.out` files of the same input, given as {name: path}, into merged records."""
+    names = list(output_paths)
+    streams = [storage_for(output_paths[name]).iter_lines(output_paths[name]) for name in names]
+    count = 0
+    with storage_for(output_path).open_write(output_path) as out:
+        while True:
+            lines = [next(stream, None) for stream in streams]
+            if all(line is None for line in lines):
+                break
+            if any(line is None for line in lines):
+                raise ValueError('Outputs have different record counts: %s ended after %d records' % (
+                    ', '.join(name for name, line in zip(names, lines) if line is None), count))
+            records = [json.loads(line) for line in lines]
+            ids = [record.get('id') for record in records]
+            if any(i != ids[0] for i in ids):
+                raise ValueError('Outputs are not aligned at record %d: ids %s' % (
+                    count, ', '.join('%s=%r' % pair for pair in zip(names, ids))))
+            record = {key: value for key, value in records[0].items() if key != 'SageMakerOutput'}
+            spans = {name: r['SageMakerOutput']['ner'] for name, r in zip(names, records)}
+            out.write(sagemaker_jsonlines.dumps(merged_output(record, spans, ner_only)))
+            out.write('\n')
+            count += 1
+    return count
+
+
+def _named(value):
+    name, separator, rest = value.partition('=')
+    if not separator or not name:
+        raise argparse.ArgumentTypeError('expected name=value, got %r' % value)
+    return name, rest
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run several NER models over one JSON-lines corpus in one pass.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='send the input to every backend and merge the results')
+    run_parser.add_argument('input', help='JSON-lines file of {"id", "instance"} records')
+    run_parser.add_argument('output', help='path of the merged .jl.out file to write')
+    run_parser.add_argument('--backend', type=_named, action='append', required=True,
+                            help='name=sagemaker:<endpoint>, name=http(s)://.../invocations or name=module:attribute')
+    run_parser.add_argument('--model-kwargs', type=_named, action='append', default=[],
+                            help='name=JSON object passed to a local model class')
+    run_parser.add_argument('--chunk-size', type=int, default=100, help='records per request to each backend')
+    run_parser.add_argument('--max-pending', type=int, default=4, help='chunks in flight at once')
+    run_parser.add_argument('--ner-only', action='store_true', help='write only {"id", "ner"} per record')
+
+    merge_parser = commands.add_parser('merge', help='merge per-model Batch Transform outputs of one input')
+    merge_parser.add_argument('output')
+    merge_parser.add_argument('inputs', type=_named, nargs='+', help='name=path of each model\'s .jl.out')
+    merge_parser.add_argument('--ner-only', action='store_true', help='write only {"id", "ner"} per record')
+    args = parser.parse_args()
+
+    if args.command == 'merge':
+        count = merge_outputs(dict(args.inputs), args.output, args.ner_only)
+        print('Merged %d records from %d models into %s' % (count, len(args.inputs), args.output))
+        return
+
+    model_kwargs = {name: json.loads(value) for name, value in args.model_kwargs}
+    backends = {name: make_backend(spec, model_kwargs.get(name)) for name, spec in args.backend}
+    start = time.perf_counter()
+    try:
+        count = run_fanout(args.input, args.output, backends, args.chunk_size, args.max_pending, args.ner_only)
+    finally:
+        for backend in backends.values():
+            if isinstance(backend, ProcessModel):
+                backend.close()
+    print('Wrote %d records from %d models to %s in %.2f s' % (count, len(backends), args.output,
+                                                              time.perf_counter() - start))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+# Local stand-ins for the NER model packages.
+#
+# A model is any callable taking a list of `instance` strings and returning,
+# for each one, a list of spans shaped like the containers' output:
+#   {"start_pos": int, "end_pos": int, "key": str, "type": str}
+
+import re
+
+from marketplace_tools.sagemaker_jsonlines import iter_records
+
+
+class ReplayModel:
+    """Answer with the spans recorded for each instance in a `.jl.out` file."""
+
+    def __init__(self, path):
+        self.spans = {}
+        for record in iter_records(path):
+            self.spans[record['instance']] = record['SageMakerOutput']['ner']
+
+    def __call__(self, instances):
+        return [self.spans.get(instance, []) for instance in instances]
+
+
+class GazetteerModel:
+    """Tag every whole-word occurrence of known entity strings.
+
+    Entities come from a `{key: type}` mapping and/or the spans recorded in
+    `.jl.out` files; when several keys overlap the longest one wins.
+    """
+
+    def __init__(self, entities=None, paths=(), ignore_case=False):
+        self.types = {}
+        for path in paths:
+            for record in iter_records(path):
+                for span in record['SageMakerOutput']['ner']:
+                    self.types.setdefault(span['key'], span['type'])
+        self.types.update(entities or {})
+        self.ignore_case = ignore_case
+        if ignore_case:
+            self.types = {key.lower(): value for key, value in self.types.items()}
+        keys = sorted(self.types, key=len, reverse=True)
+        self.pattern = re.compile(r'(?<!\w)(?:%s)(?!\w)' % '|'.join(map(re.escape, keys)) if keys else r'(?!)',
+                                  re.IGNORECASE if ignore_case else 0)
+
+    def __call__(self, instances):
+        results = []
+        for instance in instances:
+            spans = []
+            for match in self.pattern.finditer(instance):
+                key = match.group()
+                spans.append({'start_pos': match.start(), 'end_pos': match.end(), 'key': key,
+                              'type': self.types[key.lower() if self.ignore_case else key]})
+            results.append(spans)
+        return results
@@ -0,0 +1,44 @@
+# JSON-lines helpers matching what the 7Park model containers read and write.
+#
+# Output records are serialised the way the containers do it: sorted keys,
+# no whitespace, raw UTF-8, with the HTML-sensitive characters escaped
+# (`&` -> `\u0026` etc.), so locally produced `.jl.out` files compare
+# byte-for-byte with the ones returned by Batch Transform.
+
+import json
+
+_ESCAPES = (
+    ('&', '\\u0026'),
+    ('<', '\\u003c'),
+    ('>', '\\u003e'),
+    ('\u2028', '\\u2028'),
+    ('\u2029', '\\u2029'),
+)
+
+
+def dumps(record):
+    line = json.dumps(record, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    # These characters can only occur inside JSON strings, so a plain replace is safe.
+    for char, escaped in _ESCAPES:
+        if char in line:
+            line = line.replace(char, escaped)
+    return line
+
+
+def iter_lines(path):
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.rstrip('\n')
+            if line.strip():
+                yield line
+
+
+def iter_records(path):
+    for line in iter_lines(path):
+        yield json.loads(line)
+
+
+def ner_output(record, spans):
+    output = dict(record)
+    output['SageMakerOutput'] = {'ner': spans}
+    return output
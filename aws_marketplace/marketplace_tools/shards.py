@@ -0,0 +1,211 @@
+# Streaming split/merge of JSON-lines files around Batch Transform jobs.
+#
+# `split` cuts a large input into `instance_count` contiguous shards of about
+# the same size in bytes, so every transform instance gets one file of
+# similar cost. `merge` streams the shards' `.out` files back into a single
+# file: a k-way merge on `id` (memory bounded by one line per shard), or a
+# plain concatenation in shard order for records without ids, such as the
+# stopword transform's `{"data": ...}`. With `--ner-only` the merged records
+# are projected down to `{"id", "ner"}`.
+#
+# Paths may be local or `s3://bucket/key`; S3 access goes through boto3.
+#
+# Examples, run from the aws_marketplace directory:
+#   python -m marketplace_tools.shards split big.jl shards/ --shards 4
+#   python -m marketplace_tools.shards merge big.jl.out shards_out/ --ner-only
+
+import argparse
+import heapq
+import json
+import os
+import tempfile
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+from marketplace_tools import sagemaker_jsonlines, tracing
+
+
+class LocalStorage:
+
+    def size(self, path):
+        return os.path.getsize(path)
+
+    def iter_lines(self, path):
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                yield line.rstrip('\n')
+
+    @contextmanager
+    def open_write(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            yield f
+
+    def list(self, prefix, suffix=''):
+        if os.path.isdir(prefix):
+            return sorted(os.path.join(prefix, name) for name in os.listdir(prefix) if name.endswith(suffix))
+        return [prefix]
+
+    def join(self, prefix, name):
+        return os.path.join(prefix, name)
+
+
+class S3Storage:
+
+    def __init__(self, client=None):
+        if client is None:
+            import boto3
+            client = boto3.client('s3')
+        self.client = client
+
+    @staticmethod
+    def _split(uri):
+        parsed = urlparse(uri)
+        return parsed.netloc, parsed.path.lstrip('/')
+
+    def size(self, uri):
+        bucket, key = self._split(uri)
+        with tracing.span('s3.head_object', uri=uri):
+            return self.client.head_object(Bucket=bucket, Key=key)['ContentLength']
+
+    def iter_lines(self, uri):
+        bucket, key = self._split(uri)
+        with tracing.span('s3.get_object', uri=uri):
+            body = self.client.get_object(Bucket=bucket, Key=key)['Body']
+        for line in body.iter_lines():
+            tracing.count('s3.bytes_read', len(line) + 1)
+            yield line.decode('utf-8')
+
+    @contextmanager
+    def open_write(self, uri):
+        # Spool to a local temporary file and upload once it is complete.
+        bucket, key = self._split(uri)
+        with tempfile.NamedTemporaryFile('w+', encoding='utf-8', suffix='.jl') as f:
+            yield f
+            f.flush()
+            with tracing.span('s3.upload_file', uri=uri, bytes=f.tell()):
+                self.client.upload_file(f.name, bucket, key)
+
+    def list(self, prefix, suffix=''):
+        bucket, key_prefix = self._split(prefix)
+        keys = []
+        for page in self.client.get_paginator('list_objects_v2').paginate(Bucket=bucket, Prefix=key_prefix):
+            keys.extend(o['Key'] for o in page.get('Contents', []) if o['Key'].endswith(suffix))
+        return ['s3://%s/%s' % (bucket, key) for key in sorted(keys)]
+
+    def join(self, prefix, name):
+        return prefix.rstrip('/') + '/' + name
+
+
+def storage_for(path):
+    return S3Storage() if path.startswith('s3://') else LocalStorage()
+
+
+def shard_name(input_path, index):
+    stem, ext = os.path.splitext(os.path.basename(urlparse(input_path).path))
+    return '%s-%05d%s' % (stem, index, ext)
+
+
+@tracing.traced('shards.split')
+def split(input_path, output_prefix, shards, storage=None, output_storage=None):
+    """Split input_path into `shards` contiguous files of roughly equal byte size; return their paths."""
+    storage = storage or storage_for(input_path)
+    output_storage = output_storage or storage_for(output_prefix)
+    target = storage.size(input_path) / shards
+    paths = []
+    lines = (line for line in storage.iter_lines(input_path) if line.strip())
+    line = next(lines, None)
+    written = 0
+    for index in range(shards):
+        if line is None:
+            break
+        path = output_storage.join(output_prefix, shard_name(input_path, index))
+        with output_storage.open_write(path) as out:
+            # Every shard gets at least one line; the last one takes whatever is left over.
+            while True:
+                out.write(line)
+                out.write('\n')
+                written += len(line.encode('utf-8')) + 1
+                line = next(lines, None)
+                if line is None or (index < shards - 1 and written >= target * (index + 1)):
+                    break
+        paths.append(path)
+    return paths
+
+
+def project_ner(record):
+    return {'id': record.get('id'), 'ner': record['SageMakerOutput']['ner']}
+
+
+def _keyed(lines, key, source):
+    previous = None
+    for line in lines:
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        value = record[key]
+        if previous is not None and value < previous:
+            raise ValueError('%s is not sorted by %r (%r follows %r)' % (source, key, value, previous))
+        previous = value
+        yield value, line, record
+
+
+def iter_merged(paths, storage=None, key='id'):
+    """Yield (line, record) from the shard outputs, merged on `key` or concatenated if key is None."""
+    storage = storage or storage_for(paths[0])
+    if key is None:
+        for path in paths:
+            for line in storage.iter_lines(path):
+                if line.strip():
+                    yield line, json.loads(line)
+        return
+    streams = [_keyed(storage.iter_lines(path), key, path) for path in paths]
+    for _, line, record in heapq.merge(*streams, key=lambda item: item[0]):
+        yield line, record
+
+
+@tracing.traced('shards.merge')
+def merge(paths, output_path, storage=None, output_storage=None, key='id', ner_only=False):
+    output_storage = output_storage or storage_for(output_path)
+    count = 0
+    with output_storage.open_write(output_path) as out:
+        for line, record in iter_merged(paths, storage, key):
+            out.write(sagemaker_jsonlines.dumps(project_ner(record)) if ner_only else line)
+            out.write('\n')
+            count += 1
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Split JSON-lines inputs into shards and merge transform outputs.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    split_parser = commands.add_parser('split', help='split an input file into balanced shards')
+    split_parser.add_argument('input')
+    split_parser.add_argument('output_prefix', help='directory or s3:// prefix for the shards')
+    split_parser.add_argument('--shards', type=int, required=True, help='usually the transform instance_count')
+
+    merge_parser = commands.add_parser('merge', help='merge shard .out files into one output')
+    merge_parser.add_argument('output')
+    merge_parser.add_argument('inputs', nargs='+', help='shard outputs, or one directory / s3:// prefix of them')
+    merge_parser.add_argument('--suffix', default='.out', help='suffix of outputs listed from a prefix')
+    merge_parser.add_argument('--key', default='id', help='field the shards are ordered by')
+    merge_parser.add_argument('--concatenate', action='store_true', help='keep shard order instead of merging on key')
+    merge_parser.add_argument('--ner-only', action='store_true', help='write only {"id", "ner"} per record')
+    args = parser.parse_args()
+
+    if args.command == 'split':
+        for path in split(args.input, args.output_prefix, args.shards):
+            print(path)
+    else:
+        paths = args.inputs
+        if len(paths) == 1:
+            paths = storage_for(paths[0]).list(paths[0], args.suffix)
+        count = merge(paths, args.output, key=None if args.concatenate else args.key, ner_only=args.ner_only)
+        print('Merged %d records from %d shards into %s' % (count, len(paths), args.output))
+
+
+if __name__ == '__main__':
+    main()
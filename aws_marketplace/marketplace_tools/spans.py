@@ -0,0 +1,344 @@
+# Columnar post-processing of NER output spans.
+#
+# `.jl.out` records are loaded into a SpanTable: one NumPy array per column
+# (record index, char start/end, key and type codes into small dictionaries)
+# instead of a list of span dicts. Validation, char -> byte / token offset
+# conversion, de-duplication, overlap merging and key/type frequency counts
+# all run as array operations. For corpora too large to hold at once,
+# `iter_span_tables` yields one table per chunk of records and
+# `count_entities` aggregates chunk by chunk.
+# Needs `numpy`. With `pyarrow` installed, files are parsed by Arrow's JSON
+# reader and the span columns are cut straight out of the parsed
+# `SageMakerOutput.ner` lists, without a Python object per span; otherwise
+# records are parsed one by one (with `orjson` when installed).
+#
+# Example, run from the aws_marketplace directory:
+#   python -m marketplace_tools.spans counts using_model_packages/*/data/samples.jl.out --by type
+
+import argparse
+import json
+from array import array
+from itertools import islice
+
+import numpy as np
+
+from marketplace_tools.sagemaker_jsonlines import iter_lines
+
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.json as pa_json
+except ImportError:
+    pa = None
+
+if pa is not None:
+    SPAN_TYPE = pa.struct([('start_pos', pa.int32()), ('end_pos', pa.int32()), ('key', pa.string()),
+                           ('type', pa.string())])
+    OUTPUT_TYPE = pa.struct([('ner', pa.list_(SPAN_TYPE))])
+
+# Code points that separate tokens for token offsets.
+WHITESPACE = np.array([c for c in range(0x3001) if chr(c).isspace()], dtype=np.uint32)
+
+
+class _Dictionary:
+
+    def __init__(self, values=()):
+        self.values = list(values)
+        self.codes = {v: i for i, v in enumerate(self.values)}
+
+    def code(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+
+class SpanTable:
+
+    def __init__(self, record_ids, texts, record_index, start, end, key_codes, keys, type_codes, types):
+        self.record_ids = record_ids
+        self.texts = texts
+        self.record_index = record_index
+        self.start = start
+        self.end = end
+        self.key_codes = key_codes
+        self.keys = keys
+        self.type_codes = type_codes
+        self.types = types
+
+    @classmethod
+    def from_records(cls, records, keep_text=True):
+        keys, types = _Dictionary(), _Dictionary()
+        record_ids, texts = [], []
+        record_index, start, end = array('i'), array('i'), array('i')
+        key_codes, type_codes = array('i'), array('i')
+        for i, record in enumerate(records):
+            record_ids.append(record.get('id', i))
+            if keep_text:
+                texts.append(record['instance'])
+            for span in record['SageMakerOutput']['ner']:
+                record_index.append(i)
+                start.append(span['start_pos'])
+                end.append(span['end_pos'])
+                key_codes.append(keys.code(span['key']))
+                type_codes.append(types.code(span['type']))
+        return cls(np.array(record_ids), texts if keep_text else None,
+                   np.frombuffer(record_index, dtype=np.int32), np.frombuffer(start, dtype=np.int32),
+                   np.frombuffer(end, dtype=np.int32), np.frombuffer(key_codes, dtype=np.int32), keys.values,
+                   np.frombuffer(type_codes, dtype=np.int32), types.values)
+
+    @classmethod
+    def from_arrow(cls, batch, keep_text=True, first_record=0):
+        """Build a table from a RecordBatch parsed by Arrow's JSON reader (see `_open_json`).
+
+        Records without an `id` column are numbered from first_record.
+        """
+        ner = pc.struct_field(batch.column('SageMakerOutput'), 'ner')
+        spans = pc.list_flatten(ner)
+        keys = pc.dictionary_encode(pc.struct_field(spans, 'key'))
+        types = pc.dictionary_encode(pc.struct_field(spans, 'type'))
+        if 'id' in batch.schema.names:
+            record_ids = batch.column('id').to_numpy(zero_copy_only=False)
+        else:
+            record_ids = np.arange(first_record, first_record + batch.num_rows)
+        return cls(record_ids, batch.column('instance').to_pylist() if keep_text else None,
+                   pc.list_parent_indices(ner).to_numpy().astype(np.int32),
+                   pc.struct_field(spans, 'start_pos').to_numpy(zero_copy_only=False),
+                   pc.struct_field(spans, 'end_pos').to_numpy(zero_copy_only=False),
+                   keys.indices.to_numpy(zero_copy_only=False), keys.dictionary.to_pylist(),
+                   types.indices.to_numpy(zero_copy_only=False), types.dictionary.to_pylist())
+
+    @classmethod
+    def from_jl_out(cls, path, keep_text=True):
+        if pa is None:
+            return cls.from_records((_loads(line) for line in iter_lines(path)), keep_text)
+        batches = list(_open_json(path, keep_text))
+        if not batches:
+            return cls.from_records([], keep_text)
+        return cls.from_arrow(pa.Table.from_batches(batches).combine_chunks().to_batches()[0], keep_text)
+
+    def __len__(self):
+        return len(self.start)
+
+    def _require_text(self):
+        if self.texts is None:
+            raise ValueError('This operation needs the instance text; load the table with keep_text=True')
+
+    def select(self, mask_or_index):
+        return SpanTable(self.record_ids, self.texts, self.record_index[mask_or_index], self.start[mask_or_index],
+                         self.end[mask_or_index], self.key_codes[mask_or_index], self.keys,
+                         self.type_codes[mask_or_index], self.types)
+
+    def key_strings(self):
+        return np.array(self.keys, dtype=object)[self.key_codes]
+
+    def type_strings(self):
+        return np.array(self.types, dtype=object)[self.type_codes]
+
+    def to_records(self):
+        """Yield (record id, span dicts) for every record that has spans."""
+        keys, types = self.key_strings(), self.type_strings()
+        order = np.argsort(self.record_index, kind='stable')
+        boundaries = np.flatnonzero(np.diff(self.record_index[order])) + 1
+        for group in np.split(order, boundaries) if len(order) else []:
+            yield self.record_ids[self.record_index[group[0]]].item(), [
+                {'start_pos': int(self.start[i]), 'end_pos': int(self.end[i]), 'key': keys[i], 'type': types[i]}
+                for i in group]
+
+    # Text geometry shared by validation and offset conversion
+
+    def _text_layout(self):
+        self._require_text()
+        lengths = np.fromiter((len(t) for t in self.texts), dtype=np.int64, count=len(self.texts))
+        bases = np.concatenate(([0], np.cumsum(lengths)))
+        return lengths, bases
+
+    def _code_points(self):
+        return np.frombuffer(''.join(self.texts).encode('utf-32-le'), dtype=np.uint32)
+
+    def valid_mask(self, check_text=True):
+        """True for spans whose offsets are in range and, if check_text, whose key matches the instance text."""
+        key_lengths = np.fromiter((len(k) for k in self.keys), dtype=np.int64, count=len(self.keys))
+        valid = (self.start >= 0) & (self.start < self.end) & (self.end - self.start == key_lengths[self.key_codes])
+        if self.texts is not None:
+            lengths, bases = self._text_layout()
+            valid &= self.end <= lengths[self.record_index]
+            index = np.flatnonzero(valid)
+            if check_text and len(index):
+                # Compare every remaining span with its key one code point at a time, all spans at once.
+                key_points = np.frombuffer(''.join(self.keys).encode('utf-32-le'), dtype=np.uint32)
+                key_bases = np.concatenate(([0], np.cumsum(key_lengths)))
+                span_lengths = (self.end[index] - self.start[index]).astype(np.int64)
+                offsets = np.concatenate(([0], np.cumsum(span_lengths)))
+                within = np.arange(offsets[-1]) - np.repeat(offsets[:-1], span_lengths)
+                text_at = np.repeat(bases[self.record_index[index]] + self.start[index], span_lengths) + within
+                key_at = np.repeat(key_bases[self.key_codes[index]], span_lengths) + within
+                mismatch = np.logical_or.reduceat(self._code_points()[text_at] != key_points[key_at], offsets[:-1])
+                valid[index[mismatch]] = False
+        return valid
+
+    def byte_offsets(self):
+        """Return UTF-8 (start, end) byte offsets of every span within its instance."""
+        _, bases = self._text_layout()
+        code_points = self._code_points()
+        widths = 1 + (code_points >= 0x80) + (code_points >= 0x800) + (code_points >= 0x10000)
+        cumulative = np.concatenate(([0], np.cumsum(widths, dtype=np.int64)))
+        record_bytes = cumulative[bases[self.record_index]]
+        return (cumulative[bases[self.record_index] + self.start] - record_bytes,
+                cumulative[bases[self.record_index] + self.end] - record_bytes)
+
+    def token_offsets(self):
+        """Return whitespace-token (start, end) offsets of every span; end is exclusive."""
+        lengths, bases = self._text_layout()
+        is_space = np.isin(self._code_points(), WHITESPACE)
+        previous_space = np.concatenate(([True], is_space[:-1]))
+        previous_space[bases[:-1][lengths > 0]] = True
+        token_starts = np.flatnonzero(~is_space & previous_space)
+        first_token = np.searchsorted(token_starts, bases[self.record_index], 'left')
+        span_start = bases[self.record_index] + self.start
+        span_end = bases[self.record_index] + self.end
+        return (np.searchsorted(token_starts, span_start, 'right') - 1 - first_token,
+                np.searchsorted(token_starts, span_end, 'left') - first_token)
+
+    # Set operations
+
+    def dedupe(self):
+        """Drop spans repeating the record, offsets and type of an earlier span."""
+        order = np.lexsort((self.type_codes, self.end, self.start, self.record_index))
+        columns = np.stack([self.record_index[order], self.start[order], self.end[order], self.type_codes[order]])
+        keep = np.concatenate(([True], np.any(np.diff(columns, axis=1) != 0, axis=0))) if len(order) else []
+        return self.select(np.sort(order[keep]))
+
+    def merge_overlapping(self, by_type=True):
+        """Merge overlapping spans of a record (of the same type if by_type) into one covering span.
+
+        The merged span takes the type of its longest member; its key is the
+        covered instance text when the table has text, else the longest member's key.
+        """
+        if not len(self):
+            return self
+        group = self.record_index.astype(np.int64)
+        if by_type:
+            group = group * len(self.types) + self.type_codes
+        # Offsetting each group by more than any end keeps groups apart in one
+        # running maximum over the whole table.
+        stride = int(self.end.max()) + 1
+        order = np.lexsort((-(group * stride + self.end), group * stride + self.start))
+        start = (group * stride + self.start)[order]
+        reach = np.maximum.accumulate((group * stride + self.end)[order])
+        new_cluster = np.concatenate(([True], start[1:] >= reach[:-1]))
+        cluster = np.cumsum(new_cluster) - 1
+        first = np.flatnonzero(new_cluster)
+        merged_start = self.start[order][first]
+        merged_end = np.maximum.reduceat(self.end[order], first)
+        lengths = (self.end - self.start)[order]
+        candidates = np.flatnonzero(lengths == np.maximum.reduceat(lengths, first)[cluster])
+        _, first_candidate = np.unique(cluster[candidates], return_index=True)
+        best = order[candidates[first_candidate]]
+
+        record_index = self.record_index[order][first]
+        type_codes = self.type_codes[best]
+        key_codes = self.key_codes[best].copy()
+        keys = list(self.keys)
+        if self.texts is not None:
+            dictionary = _Dictionary(keys)
+            changed = np.flatnonzero(merged_end - merged_start != (self.end - self.start)[best])
+            for i in changed:
+                key_codes[i] = dictionary.code(self.texts[record_index[i]][merged_start[i]:merged_end[i]])
+            keys = dictionary.values
+        merged = SpanTable(self.record_ids, self.texts, record_index, merged_start.astype(np.int32),
+                           merged_end.astype(np.int32), key_codes, keys, type_codes, self.types)
+        return merged.select(np.lexsort((merged.end, merged.start, merged.record_index)))
+
+    # Aggregation
+
+    def counts(self, by='key_type'):
+        """Return {value: count} for by in 'key', 'type' or 'key_type' ((key, type) pairs)."""
+        if by == 'key':
+            counts = np.bincount(self.key_codes, minlength=len(self.keys))
+            return {k: int(c) for k, c in zip(self.keys, counts) if c}
+        if by == 'type':
+            counts = np.bincount(self.type_codes, minlength=len(self.types))
+            return {t: int(c) for t, c in zip(self.types, counts) if c}
+        if by == 'key_type':
+            combined = self.key_codes.astype(np.int64) * len(self.types) + self.type_codes
+            values, counts = np.unique(combined, return_counts=True)
+            return {(self.keys[v // len(self.types)], self.types[v % len(self.types)]): int(c)
+                    for v, c in zip(values, counts)}
+        raise ValueError("by must be 'key', 'type' or 'key_type', not %r" % by)
+
+
+def _open_json(path, keep_text, block_bytes=2 << 20):
+    """Return an iterator of RecordBatches of the file's records (none for a file without records)."""
+    fields = [('SageMakerOutput', OUTPUT_TYPE)]
+    if keep_text:
+        fields.append(('instance', pa.string()))
+    # `id` is only needed to report spans of the text, and its type varies between corpora, so it is inferred.
+    parse_options = pa_json.ParseOptions(explicit_schema=pa.schema(fields),
+                                         unexpected_field_behavior='infer' if keep_text else 'ignore')
+    try:
+        return pa_json.open_json(path, pa_json.ReadOptions(block_size=block_bytes), parse_options)
+    except pa.ArrowInvalid:
+        if next(iter_lines(path), None) is None:
+            return iter(())
+        raise
+
+
+def iter_span_tables(path, chunk_records=100000, keep_text=False, block_bytes=2 << 20):
+    """Yield a SpanTable per chunk of the file: block_bytes of it with pyarrow, else chunk_records records."""
+    if pa is not None:
+        first_record = 0
+        for batch in _open_json(path, keep_text, block_bytes):
+            yield SpanTable.from_arrow(batch, keep_text, first_record)
+            first_record += batch.num_rows
+        return
+    lines = iter_lines(path)
+    while True:
+        chunk = [_loads(line) for line in islice(lines, chunk_records)]
+        if not chunk:
+            return
+        yield SpanTable.from_records(chunk, keep_text)
+
+
+def count_entities(paths, by='key_type', chunk_records=100000):
+    totals = {}
+    for path in paths:
+        for table in iter_span_tables(path, chunk_records):
+            for value, count in table.counts(by).items():
+                totals[value] = totals.get(value, 0) + count
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Post-process NER spans from .jl.out files.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    counts_parser = commands.add_parser('counts', help='count entity keys and/or types across files')
+    counts_parser.add_argument('paths', nargs='+')
+    counts_parser.add_argument('--by', choices=['key', 'type', 'key_type'], default='key_type')
+    counts_parser.add_argument('--top', type=int, default=20)
+    validate_parser = commands.add_parser('validate', help='report spans whose offsets do not match the text')
+    validate_parser.add_argument('paths', nargs='+')
+    args = parser.parse_args()
+
+    if args.command == 'counts':
+        totals = count_entities(args.paths, args.by)
+        for value, count in sorted(totals.items(), key=lambda item: -item[1])[:args.top]:
+            print('%10d  %s' % (count, '\t'.join(value) if isinstance(value, tuple) else value))
+    else:
+        for path in args.paths:
+            for table in iter_span_tables(path, keep_text=True):
+                invalid = table.select(~table.valid_mask())
+                for record_id, spans in invalid.to_records():
+                    for span in spans:
+                        print('%s id=%s %s' % (path, record_id, json.dumps(span, ensure_ascii=False)))
+
+
+if __name__ == '__main__':
+    main()
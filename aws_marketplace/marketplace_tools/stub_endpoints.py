@@ -0,0 +1,113 @@
+# Local stand-ins for deployed SageMaker endpoints, for offline testing and benchmarks.
+#
+# The stubs speak the container protocol (`POST /invocations`, `GET /ping`)
+# with JSON-lines bodies:
+#   StubNerEndpoint       {"id", "instance"} -> the same records plus
+#                         `SageMakerOutput.ner`, as in the samples.jl.out files
+#   StubStopwordEndpoint  {"data": "..."} -> {"source": {"data": "..."}, "stopwords": [...]},
+#                         as the Stopword Algorithm endpoint answers, matched by
+#                         the local StopwordFilter (src/stopword_transform.py)
+# Latency can be injected per request and per record, and `workers` caps how
+# many requests are processed at once, like the model workers of one instance.
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from marketplace_tools import sagemaker_jsonlines
+
+
+class StubHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+def make_jsonlines_handler(transform, latency=0.0, per_record_latency=0.0, workers=None):
+    """Handler class answering POST /invocations with transform(list of input records) as JSON-lines."""
+    slots = threading.BoundedSemaphore(workers) if workers else None
+
+    class StubJsonLinesHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def _reply(self, status, payload, content_type='application/jsonlines'):
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            self._reply(200 if self.path == '/ping' else 404, b'', 'text/plain')
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('utf-8')
+            if self.path != '/invocations':
+                self._reply(404, b'', 'text/plain')
+                return
+            records = [json.loads(line) for line in body.splitlines() if line.strip()]
+            if slots:
+                slots.acquire()
+            try:
+                if latency or per_record_latency:
+                    time.sleep(latency + per_record_latency * len(records))
+                lines = [sagemaker_jsonlines.dumps(r) for r in transform(records)]
+            finally:
+                if slots:
+                    slots.release()
+            self._reply(200, ''.join(line + '\n' for line in lines).encode('utf-8'))
+
+    return StubJsonLinesHandler
+
+
+def make_ner_handler(model, latency=0.0, per_record_latency=0.0, workers=None):
+
+    def transform(records):
+        spans = model([r['instance'] for r in records])
+        return [sagemaker_jsonlines.ner_output(r, s) for r, s in zip(records, spans)]
+
+    return make_jsonlines_handler(transform, latency, per_record_latency, workers)
+
+
+def make_stopword_handler(stopwords, latency=0.0, per_record_latency=0.0, workers=None, field='data'):
+    from using_algorithm.stopword_algorithm.src.stopword_transform import StopwordFilter
+
+    return make_jsonlines_handler(StopwordFilter(stopwords, field).transform_batch, latency, per_record_latency,
+                                  workers)
+
+
+class StubEndpoint:
+    """Serve a handler class on a background thread; usable as a context manager."""
+
+    def __init__(self, handler, host='127.0.0.1', port=0):
+        self.httpd = StubHTTPServer((host, port), handler)
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return 'http://%s:%s/invocations' % (host, port)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class StubNerEndpoint(StubEndpoint):
+
+    def __init__(self, model, latency=0.0, per_record_latency=0.0, workers=None, host='127.0.0.1', port=0):
+        super().__init__(make_ner_handler(model, latency, per_record_latency, workers), host, port)
+
+
+class StubStopwordEndpoint(StubEndpoint):
+
+    def __init__(self, stopwords, latency=0.0, per_record_latency=0.0, workers=None, host='127.0.0.1', port=0):
+        super().__init__(make_stopword_handler(stopwords, latency, per_record_latency, workers), host, port)
@@ -0,0 +1,277 @@
+# Lightweight timing spans, counters and histograms for the marketplace tools.
+#
+# Tracing is off unless the TRACE_FILE environment variable names a file (or
+# `enable()` is called); while off, `span()` hands back a shared no-op context
+# manager and `@traced` functions are called straight through, so the
+# instrumented code pays one global lookup per call.
+#
+# While on, every finished span is appended to the trace file as one JSON line
+#   {"name", "span_id", "parent_id", "trace_id", "start", "duration_ms",
+#    "thread", "pid", "attributes", "error"}
+# and its duration is added to a per-name histogram. Spans nest through
+# contextvars, so parents follow asyncio tasks as well as plain calls; a span
+# should not stay open across a generator's `yield`.
+# A summary table of the process's spans and counters is printed to stderr at
+# exit; worker processes append to the same trace file, and
+#   python -m marketplace_tools.tracing trace.jl
+# summarises a whole trace file afterwards.
+# Standard library only, so the AKM scripts load this file too (see
+# scripts/tracing.py).
+#
+# Example, run from the aws_marketplace directory:
+#   TRACE_FILE=/tmp/fanout_trace.jl python -m marketplace_tools.ner_fanout run corpus.jl corpus.jl.out \
+#       --backend drug_ner=http://127.0.0.1:8080/invocations
+
+import argparse
+import atexit
+import contextvars
+import functools
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+_current = contextvars.ContextVar('tracing_current_span', default=None)
+_tracer = None
+
+
+class Histogram:
+    """Count, total, min/max and log-spaced buckets (4 per doubling) of millisecond values."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+        self.buckets = Counter()
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        self.buckets[math.ceil(4 * math.log2(value)) if value > 0 else None] += 1
+
+    def percentile(self, q):
+        """Upper bound of the bucket holding the q-quantile, capped at the maximum seen."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bucket in sorted(self.buckets, key=lambda b: -math.inf if b is None else b):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return 0.0 if bucket is None else min(2 ** (bucket / 4), self.max)
+        return self.max
+
+
+class Span:
+
+    __slots__ = ('tracer', 'name', 'attributes', 'span_id', 'parent_id', 'trace_id', 'start', '_wall', '_token')
+
+    def __init__(self, tracer, name, attributes):
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def __enter__(self):
+        parent = _current.get()
+        self.span_id = '%016x' % random.getrandbits(64)
+        self.parent_id = parent.span_id if parent else None
+        self.trace_id = parent.trace_id if parent else self.span_id
+        self._token = _current.set(self)
+        self._wall = time.time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = (time.perf_counter() - self.start) * 1000
+        _current.reset(self._token)
+        self.tracer.finish(self, duration, None if exc_type is None else '%s: %s' % (exc_type.__name__, exc))
+        return False
+
+
+class _NoopSpan:
+
+    __slots__ = ()
+
+    def set(self, **attributes):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Tracer:
+
+    def __init__(self, path=None):
+        self.path = path
+        self.histograms = {}
+        self.counters = Counter()
+        self.errors = Counter()
+        self._lock = threading.Lock()
+        self._file = open(path, 'a', encoding='utf-8') if path else None
+
+    def span(self, name, **attributes):
+        return Span(self, name, attributes)
+
+    def finish(self, span, duration, error):
+        line = None
+        if self._file is not None:
+            line = json.dumps({'name': span.name, 'span_id': span.span_id, 'parent_id': span.parent_id,
+                               'trace_id': span.trace_id, 'start': span._wall, 'duration_ms': round(duration, 3),
+                               'thread': threading.current_thread().name, 'pid': os.getpid(),
+                               'attributes': span.attributes, 'error': error}, default=str) + '\n'
+        with self._lock:
+            histogram = self.histograms.get(span.name)
+            if histogram is None:
+                histogram = self.histograms[span.name] = Histogram()
+            histogram.add(duration)
+            if error:
+                self.errors[span.name] += 1
+            if line is not None:
+                # One write per line keeps lines from several processes whole in an O_APPEND file.
+                self._file.write(line)
+                self._file.flush()
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    def observe(self, name, value):
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.add(value)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def summary(self):
+        with self._lock:
+            return summary_table(self.histograms, self.counters, self.errors)
+
+
+def summary_table(histograms, counters=None, errors=None):
+    lines = ['%-32s %8s %7s %11s %9s %9s %9s %9s' % ('span', 'count', 'errors', 'total ms', 'mean ms', 'p50 ms',
+                                                     'p95 ms', 'p99 ms')]
+    for name, h in sorted(histograms.items(), key=lambda item: -item[1].total):
+        lines.append('%-32s %8d %7d %11.1f %9.2f %9.2f %9.2f %9.2f' % (
+            name, h.count, (errors or {}).get(name, 0), h.total, h.total / h.count, h.percentile(0.5),
+            h.percentile(0.95), h.percentile(0.99)))
+    if counters:
+        lines.append('')
+        lines.append('%-32s %8s' % ('counter', 'value'))
+        for name, value in sorted(counters.items()):
+            lines.append('%-32s %8d' % (name, value))
+    return '\n'.join(lines)
+
+
+def enable(path=None, summary_at_exit=True):
+    """Start recording spans, appending them to `path` if given; return the tracer."""
+    global _tracer
+    disable()
+    _tracer = Tracer(path)
+    if summary_at_exit:
+        atexit.register(_print_summary, _tracer)
+    return _tracer
+
+
+def disable():
+    global _tracer
+    if _tracer is not None:
+        _tracer.close()
+        _tracer = None
+
+
+def enabled():
+    return _tracer is not None
+
+
+def tracer():
+    return _tracer
+
+
+def span(name, **attributes):
+    """Context manager timing a block as a span; a no-op while tracing is off."""
+    if _tracer is None:
+        return NOOP_SPAN
+    return _tracer.span(name, **attributes)
+
+
+def traced(name=None):
+    """Decorator timing every call of a function as a span (default name: module.qualname)."""
+
+    def decorate(func):
+        span_name = name or '%s.%s' % (func.__module__, func.__qualname__)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _tracer is None:
+                return func(*args, **kwargs)
+            with _tracer.span(span_name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
+def count(name, n=1):
+    if _tracer is not None:
+        _tracer.count(name, n)
+
+
+def observe(name, value):
+    if _tracer is not None:
+        _tracer.observe(name, value)
+
+
+def _print_summary(t):
+    if t.histograms or t.counters:
+        print('\nTrace summary (pid %d%s)\n%s' % (os.getpid(), ', spans in %s' % t.path if t.path else '',
+                                                   t.summary()), file=sys.stderr)
+
+
+def summarize_file(path):
+    histograms, errors = {}, Counter()
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            histograms.setdefault(record['name'], Histogram()).add(record['duration_ms'])
+            if record.get('error'):
+                errors[record['name']] += 1
+    return summary_table(histograms, errors=errors)
+
+
+if os.environ.get('TRACE_FILE'):
+    enable(os.environ['TRACE_FILE'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Summarise a JSON-lines trace file.')
+    parser.add_argument('trace', help='file written with TRACE_FILE set')
+    args = parser.parse_args()
+    print(summarize_file(args.trace))
+
+
+if __name__ == '__main__':
+    main()
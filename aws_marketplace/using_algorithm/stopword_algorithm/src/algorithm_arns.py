@@ -1,8 +1,15 @@
+import os
+import runpy
+
+# The ARNs are kept in marketplace_tools/arns.json, shared by all products.
+# arn_registry.py is run from its file rather than imported, so this leaves
+# sys.path alone and nothing from aws_marketplace can shadow the caller's modules.
+registry = runpy.run_path(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, os.pardir,
+                                       'marketplace_tools', 'arn_registry.py'))['registry']
+
+
 class AlgorithmArnProvider:
 
     @staticmethod
     def get_algorithm_arn(current_region):
-        mapping = {
-            "us-east-2": "arn:aws:sagemaker:us-east-2:084888172679:algorithm/stopword-2020-02-14-5",
-        }
-        return mapping[current_region]
+        return registry.arn('stopword_algorithm', current_region)
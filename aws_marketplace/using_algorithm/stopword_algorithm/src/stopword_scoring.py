@@ -0,0 +1,213 @@
+# Local stopword scoring with the same hyperparameters and output as the
+# marketplace Stopword Algorithm.
+#
+# Every non-empty line of the training file is a document. One streaming pass
+# counts, for every term, its total occurrences and the number of documents it
+# occurs in; memory is bounded by the vocabulary size. Large files are split
+# into byte ranges on line boundaries and counted in parallel (map), and the
+# per-range counts are summed (reduce).
+#
+# A term's weight combines how frequent it is, how evenly it is spread over
+# documents and how common it is in English at large. Spread is the term's
+# document frequency relative to the one expected if its occurrences were
+# scattered at random over documents of the observed lengths (kept as a small
+# histogram): frequent, evenly spread terms ("natural" in Darwin) are
+# stopword candidates, frequent but bursty ones ("varieties") much less so.
+# `strategy` sets how hard burstiness is penalised: 'conservative' keeps only
+# very evenly spread terms, 'aggressive' lets frequency dominate. Words near
+# the top of general-English frequency lists ("the", "of", "is") are common
+# in every corpus and already on classical stopword lists, so they are
+# discounted by their rank in COMMON_ENGLISH; less common function words
+# ("may", "each", "its") are barely affected. The weight written out is the
+# surprisal, -log2, of the discounted and spread-weighted term rate: low for
+# low-information terms, which come first.
+#
+# Output is the `stopword<TAB>score` TSV found in the trained model.tar.gz,
+# in the same ascending order. The algorithm is proprietary, so the scores
+# and the exact list differ: with the notebook's settings on darwin.txt the
+# 50 hits include all 13 words of the notebook's list, plus "nature", but
+# also "selection" and "species", which the algorithm leaves out.
+#
+# Example, run from the stopword_algorithm directory:
+#   python -m src.stopword_scoring data/train_data_example/darwin.txt stopwords.tsv \
+#       --number-of-hits 50 --strategy medium --blacklist "what;it;my"
+
+import argparse
+import math
+import os
+import re
+from collections import Counter
+from multiprocessing import Pool
+
+STRATEGIES = {
+    'conservative': 2.0,
+    'medium': 1.0,
+    'aggressive': 0.5,
+}
+# The most frequent words of general English, most frequent first.
+COMMON_ENGLISH = (
+    'the', 'of', 'and', 'to', 'a', 'in', 'that', 'is', 'it', 'was', 'for', 'i', 'on', 'with', 'as', 'be', 'he',
+    'you', 'at', 'by', 'this', 'are', 'but', 'have', 'not', 'his', 'from', 'had', 'they', 'or', 'which', 'an',
+    'were', 'she', 'we', 'her', 'one', 'there', 'all', 'their', 'been', 'do', 'has', 'would', 'will', 'what', 'if',
+    'can', 'more', 'when', 'so', 'who', 'no', 'said', 'about', 'up', 'them', 'some', 'could', 'him', 'into', 'its',
+    'out', 'time', 'then', 'two', 'my', 'than', 'only', 'other', 'like', 'new', 'also', 'me', 'these', 'first',
+    'may', 'now', 'your', 'any', 'over', 'people', 'after', 'very', 'most', 'just', 'made', 'such', 'know', 'should',
+    'did', 'well', 'way', 'our', 'even', 'many', 'those', 'years', 'make', 'how'
+)
+COMMON_RANK = {word: rank for rank, word in enumerate(COMMON_ENGLISH, 1)}
+# Rank around which the general-English discount fades out, and how sharply.
+DISCOUNT_RANK = 35
+DISCOUNT_POWER = 6
+# The algorithm's documented range for number_of_hits (hyperparameter table in generate_stopword.ipynb).
+MAX_HITS = 100
+TOKEN = re.compile(r"[^\W\d_]+(?:'[^\W\d_]+)*")
+
+
+def tokenize(text):
+    return TOKEN.findall(text.lower())
+
+
+class TermCounts:
+
+    def __init__(self):
+        self.term_frequency = Counter()
+        self.document_frequency = Counter()
+        self.document_lengths = Counter()
+        self.documents = 0
+        self.tokens = 0
+
+    def add_document(self, text):
+        tokens = tokenize(text)
+        if not tokens:
+            return
+        self.documents += 1
+        self.tokens += len(tokens)
+        self.document_lengths[len(tokens)] += 1
+        self.term_frequency.update(tokens)
+        self.document_frequency.update(set(tokens))
+
+    def update(self, other):
+        self.term_frequency.update(other.term_frequency)
+        self.document_frequency.update(other.document_frequency)
+        self.document_lengths.update(other.document_lengths)
+        self.documents += other.documents
+        self.tokens += other.tokens
+        return self
+
+
+def byte_ranges(path, chunk_bytes):
+    size = os.path.getsize(path)
+    return [(path, start, min(start + chunk_bytes, size)) for start in range(0, size, chunk_bytes)]
+
+
+def count_range(task):
+    """Count the documents whose line starts within [start, end) of the file."""
+    path, start, end = task
+    counts = TermCounts()
+    with open(path, 'rb') as f:
+        if start:
+            # Skip the rest of a line that began before this range.
+            f.seek(start - 1)
+            f.readline()
+        position = f.tell()
+        while position < end:
+            line = f.readline()
+            if not line:
+                break
+            position += len(line)
+            counts.add_document(line.decode('utf-8', errors='replace'))
+    return counts
+
+
+def count_terms(paths, workers=None, chunk_bytes=64 * 1024 * 1024):
+    tasks = [task for path in paths for task in byte_ranges(path, chunk_bytes)]
+    totals = TermCounts()
+    if workers == 0 or len(tasks) <= 1:
+        for task in tasks:
+            totals.update(count_range(task))
+        return totals
+    with Pool(workers) as pool:
+        for counts in pool.imap_unordered(count_range, tasks):
+            totals.update(counts)
+    return totals
+
+
+def length_bins(document_lengths, bins_per_doubling=4):
+    # Group document lengths into geometric bins of (document count, mean length)
+    # so scoring costs O(vocabulary x bins) however many distinct lengths there are.
+    bins = {}
+    for length, count in document_lengths.items():
+        b = int(math.log2(length) * bins_per_doubling)
+        documents, tokens = bins.get(b, (0, 0))
+        bins[b] = (documents + count, tokens + count * length)
+    return [(documents, tokens / documents) for documents, tokens in bins.values()]
+
+
+def common_discount(term):
+    rank = COMMON_RANK.get(term)
+    return 1.0 if rank is None else 1.0 / (1.0 + (DISCOUNT_RANK / rank) ** DISCOUNT_POWER)
+
+
+def score_terms(counts, strategy='medium'):
+    """Return {term: weight}; the lower the weight, the stronger a stopword the term is."""
+    penalty = STRATEGIES[strategy]
+    bins = length_bins(counts.document_lengths)
+    scores = {}
+    for term, frequency in counts.term_frequency.items():
+        rate = frequency / counts.tokens
+        expected_documents = sum(documents * -math.expm1(-rate * length) for documents, length in bins)
+        spread = min(1.0, counts.document_frequency[term] / expected_documents)
+        scores[term] = -math.log2(spread ** penalty * rate * common_discount(term))
+    return scores
+
+
+def parse_blacklist(blacklist):
+    return {word.strip().lower() for word in (blacklist or '').split(';') if word.strip()}
+
+
+def select_stopwords(scores, number_of_hits=100, blacklist=''):
+    excluded = parse_blacklist(blacklist)
+    ranked = sorted((item for item in scores.items() if item[0] not in excluded),
+                    key=lambda item: (item[1], item[0]))
+    return ranked[:number_of_hits]
+
+
+def write_tsv(stopwords, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        for word, score in stopwords:
+            f.write('%s\t%.6f\n' % (word, score))
+
+
+def generate_stopwords(paths, number_of_hits=100, strategy='medium', blacklist='', workers=None,
+                       chunk_bytes=64 * 1024 * 1024):
+    if not 1 <= number_of_hits <= MAX_HITS:
+        raise ValueError('number_of_hits must be between 1 and %d, got %s' % (MAX_HITS, number_of_hits))
+    if strategy not in STRATEGIES:
+        raise ValueError('strategy must be one of %s, got %r' % (', '.join(STRATEGIES), strategy))
+    counts = count_terms(paths, workers, chunk_bytes)
+    return select_stopwords(score_terms(counts, strategy), number_of_hits, blacklist)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compute a stopword list locally, as the Stopword Algorithm does.')
+    parser.add_argument('inputs', nargs='+', help='training text files, one document per line')
+    parser.add_argument('output', help='path of the stopword<TAB>score TSV to write')
+    parser.add_argument('--number-of-hits', type=int, default=100, help='number of output stopwords (1-%d)' % MAX_HITS)
+    parser.add_argument('--strategy', choices=list(STRATEGIES), default='medium')
+    parser.add_argument('--blacklist', default='', help="words that are never stopwords, separated by ';'")
+    parser.add_argument('--workers', type=int, default=None, help='worker processes; 0 counts in this process')
+    parser.add_argument('--chunk-mb', type=int, default=64, help='size of the file ranges counted by each task')
+    args = parser.parse_args()
+    if not 1 <= args.number_of_hits <= MAX_HITS:
+        parser.error('--number-of-hits must be between 1 and %d' % MAX_HITS)
+    if args.chunk_mb < 1:
+        parser.error('--chunk-mb must be at least 1')
+
+    stopwords = generate_stopwords(args.inputs, args.number_of_hits, args.strategy, args.blacklist, args.workers,
+                                   args.chunk_mb * 1024 * 1024)
+    write_tsv(stopwords, args.output)
+    print('Wrote %d stopwords to %s' % (len(stopwords), args.output))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+# Local stand-in for the Stopword Algorithm's endpoint and transform job on
+# `{"data": "..."}` JSON-lines records. Every record is answered the way the
+# endpoint does (see generate_stopword.ipynb):
+#   {"source": {"data": "life is beautiful"}, "stopwords": ["life"]}
+# where `stopwords` lists the distinct stopwords found in the text, lower-cased
+# and in order of first occurrence.
+#
+# The stopword TSV (as written by training or by stopword_scoring.py) is
+# loaded once into a frozenset; records are then matched in batches, either
+# in-process through StopwordFilter or as a streaming CLI over a JSON-lines
+# file (optionally across worker processes, keeping input order).
+#
+# Example, run from the stopword_algorithm directory:
+#   python -m src.stopword_transform stopwords.tsv data/transform_data_example/samples.jl samples.jl.out
+
+import argparse
+import json
+import string
+import sys
+from itertools import islice
+from multiprocessing import Pool
+
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
+
+PUNCTUATION = string.punctuation + '\u201c\u201d\u2018\u2019\u00ab\u00bb\u2014\u2013\u2026'
+MAX_CACHED_WORDS = 1000000
+
+
+class StopwordFilter:
+
+    def __init__(self, stopwords, field='data'):
+        self.stopwords = frozenset(word.lower() for word in stopwords)
+        self.field = field
+        # Raw token -> matched stopword or None. Text is Zipfian, so most tokens
+        # are answered by one dict lookup instead of lower() + strip() + set lookup.
+        self._matches = {}
+        self._encode = json.JSONEncoder(ensure_ascii=False).encode
+
+    @classmethod
+    def from_tsv(cls, path, field='data'):
+        with open(path, encoding='utf-8') as f:
+            return cls((line.split('\t', 1)[0].strip() for line in f if line.strip()), field)
+
+    def _match(self, word):
+        word = word.lower().strip(PUNCTUATION)
+        return word if word in self.stopwords else None
+
+    def find_stopwords(self, text):
+        matches = self._matches
+        if len(matches) >= MAX_CACHED_WORDS:
+            matches.clear()
+        found = {}
+        for word in text.split():
+            match = matches.get(word, False)
+            if match is False:
+                match = matches[word] = self._match(word)
+            if match is not None:
+                found[match] = None
+        return list(found)
+
+    def transform(self, record):
+        return {'source': record, 'stopwords': self.find_stopwords(record[self.field])}
+
+    def transform_batch(self, records):
+        return [self.transform(record) for record in records]
+
+    def transform_lines(self, lines):
+        field, find_stopwords, encode = self.field, self.find_stopwords, self._encode
+        output = []
+        for line in lines:
+            record = _loads(line)
+            output.append(encode({'source': record, 'stopwords': find_stopwords(record[field])}))
+        return output
+
+
+_filter = None
+
+
+def _init_worker(path, field):
+    global _filter
+    _filter = StopwordFilter.from_tsv(path, field)
+
+
+def _transform_lines(lines):
+    return _filter.transform_lines(lines)
+
+
+def iter_batches(lines, batch_size):
+    lines = (line for line in lines if line.strip())
+    while True:
+        batch = list(islice(lines, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def transform_stream(stopword_path, lines, out, batch_size=10000, workers=0, field='data'):
+    batches = iter_batches(lines, batch_size)
+    count = 0
+    if workers:
+        with Pool(workers, initializer=_init_worker, initargs=(stopword_path, field)) as pool:
+            for output in pool.imap(_transform_lines, batches):
+                out.write('\n'.join(output) + '\n')
+                count += len(output)
+        return count
+    stopword_filter = StopwordFilter.from_tsv(stopword_path, field)
+    for batch in batches:
+        output = stopword_filter.transform_lines(batch)
+        out.write('\n'.join(output) + '\n')
+        count += len(output)
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Find the stopwords of {"data": ...} JSON-lines records, '
+                                                 'answering as the Stopword Algorithm endpoint does.')
+    parser.add_argument('stopwords', help='stopword<TAB>score TSV')
+    parser.add_argument('input', nargs='?', default='-', help="JSON-lines input, '-' for stdin")
+    parser.add_argument('output', nargs='?', default='-', help="JSON-lines output, '-' for stdout")
+    parser.add_argument('--field', default='data', help='record field holding the text')
+    parser.add_argument('--batch-size', type=int, default=10000, help='records matched per batch')
+    parser.add_argument('--workers', type=int, default=0, help='worker processes; 0 matches in this process')
+    args = parser.parse_args()
+
+    source = sys.stdin if args.input == '-' else open(args.input, encoding='utf-8')
+    target = sys.stdout if args.output == '-' else open(args.output, 'w', encoding='utf-8')
+    try:
+        count = transform_stream(args.stopwords, source, target, args.batch_size, args.workers, args.field)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if target is not sys.stdout:
+            target.close()
+    print('Matched %d records' % count, file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
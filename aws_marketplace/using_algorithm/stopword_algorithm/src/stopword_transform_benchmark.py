@@ -0,0 +1,60 @@
+# Throughput of the local stopword transform on a synthetic JSON-lines file.
+#
+# Builds `--records` `{"data": ...}` records from the Darwin training text,
+# then matches them in-process and with worker processes, reporting
+# records/sec and MB/sec for each run.
+#
+# Example, run from the stopword_algorithm directory:
+#   python -m src.stopword_transform_benchmark --records 1000000
+
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+from src.stopword_scoring import generate_stopwords, tokenize, write_tsv
+from src.stopword_transform import transform_stream
+
+TRAIN_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                          'data', 'train_data_example', 'darwin.txt')
+
+
+def write_synthetic_records(path, records, words_per_record=12, seed=0):
+    with open(TRAIN_FILE, encoding='utf-8') as f:
+        vocabulary = tokenize(f.read())
+    rng = random.Random(seed)
+    with open(path, 'w', encoding='utf-8') as f:
+        for _ in range(records):
+            text = ' '.join(rng.choice(vocabulary) for _ in range(rng.randint(1, 2 * words_per_record)))
+            f.write(json.dumps({'data': text}) + '\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the local stopword transform.')
+    parser.add_argument('--records', type=int, default=1000000)
+    parser.add_argument('--batch-size', type=int, default=10000)
+    parser.add_argument('--workers', type=int, nargs='*', default=[0, os.cpu_count()],
+                        help='worker counts to compare; 0 matches in the benchmark process')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        stopword_path = os.path.join(directory, 'stopwords.tsv')
+        input_path = os.path.join(directory, 'records.jl')
+        output_path = os.path.join(directory, 'records.jl.out')
+        write_tsv(generate_stopwords([TRAIN_FILE], number_of_hits=100, workers=0), stopword_path)
+        write_synthetic_records(input_path, args.records)
+        megabytes = os.path.getsize(input_path) / 1e6
+
+        print('%-10s %12s %10s %10s' % ('workers', 'records/s', 'MB/s', 'seconds'))
+        for workers in args.workers:
+            start = time.perf_counter()
+            with open(input_path, encoding='utf-8') as source, open(output_path, 'w', encoding='utf-8') as target:
+                transform_stream(stopword_path, source, target, args.batch_size, workers)
+            seconds = time.perf_counter() - start
+            print('%-10d %12.0f %10.1f %10.2f' % (workers, args.records / seconds, megabytes / seconds, seconds))
+
+
+if __name__ == '__main__':
+    main()
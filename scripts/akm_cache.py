@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+
+# Persistent on-disk cache for AKM API responses.
+# Entries live in a SQLite file keyed by URL plus query parameters. Each
+# endpoint has its own TTL; once an entry is stale it is revalidated with
+# If-None-Match / If-Modified-Since so an unchanged resource costs a 304
+# instead of a full download. The file is kept under a byte budget by evicting
+# the least recently used entries.
+
+import os
+import re
+import sqlite3
+import threading
+import time
+from urllib.parse import urlencode
+
+DAY = 24 * 60 * 60
+
+# Metadata endpoints change rarely; time series and forecasts are not cached
+# unless a TTL is configured for them explicitly.
+DEFAULT_TTLS = {
+    'companies': DAY,
+    'metrics': DAY,
+    'entities': DAY,
+    'queries': DAY,
+}
+
+ENDPOINT_PATTERNS = [
+    ('companies', re.compile(r'^companies$')),
+    ('metrics', re.compile(r'^company/[^/]+/metrics$')),
+    ('entities', re.compile(r'^company/[^/]+/metric/[^/]+/entities$')),
+    ('queries', re.compile(r'^company/[^/]+/metric/[^/]+/entity/[^/]+/queries$')),
+    ('data', re.compile(r'^data$')),
+    ('forecasts', re.compile(r'^forecasts$')),
+    ('forecast', re.compile(r'^company/[^/]+/metric/[^/]+/entity/[^/]+/forecast$')),
+    ('forecast_history', re.compile(r'^company/[^/]+/metric/[^/]+/entity/[^/]+/forecast/history$')),
+    ('forecast_snapshot', re.compile(r'^company/[^/]+/metric/[^/]+/entity/[^/]+/forecast/snapshot$')),
+]
+
+
+def endpoint_name(path):
+    path = path.strip('/')
+    for name, pattern in ENDPOINT_PATTERNS:
+        if pattern.match(path):
+            return name
+    return None
+
+
+class CacheEntry:
+
+    def __init__(self, body, etag, last_modified, expires_at):
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.expires_at = expires_at
+
+    @property
+    def fresh(self):
+        return time.time() < self.expires_at
+
+    def validators(self):
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class ResponseCache:
+
+    def __init__(self, path, ttls=None, max_bytes=256 * 1024 * 1024):
+        self.path = path
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self.max_bytes = max_bytes
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # One connection shared by the client's worker threads, serialised by a lock.
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS responses ('
+                         'key TEXT PRIMARY KEY, body BLOB NOT NULL, etag TEXT, last_modified TEXT, '
+                         'expires_at REAL NOT NULL, accessed_at REAL NOT NULL, size INTEGER NOT NULL)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)')
+        self._total_bytes = self._db.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def ttl_for(self, path):
+        """Return the TTL in seconds for `path`, or None if its endpoint is not cached."""
+        return self.ttls.get(endpoint_name(path))
+
+    @staticmethod
+    def key(url, params=None):
+        if params:
+            return url + '?' + urlencode(sorted(params.items()))
+        return url
+
+    def get(self, key):
+        with self._lock:
+            row = self._db.execute('SELECT body, etag, last_modified, expires_at FROM responses WHERE key = ?',
+                                   (key,)).fetchone()
+            if row is None:
+                return None
+            self._db.execute('UPDATE responses SET accessed_at = ? WHERE key = ?', (time.time(), key))
+        return CacheEntry(*row)
+
+    def put(self, key, body, ttl, etag=None, last_modified=None):
+        now = time.time()
+        with self._lock:
+            old = self._db.execute('SELECT size FROM responses WHERE key = ?', (key,)).fetchone()
+            self._db.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)',
+                             (key, body, etag, last_modified, now + ttl, now, len(body)))
+            self._total_bytes += len(body) - (old[0] if old else 0)
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def refresh(self, key, ttl):
+        now = time.time()
+        with self._lock:
+            self._db.execute('UPDATE responses SET expires_at = ?, accessed_at = ? WHERE key = ?',
+                             (now + ttl, now, key))
+
+    def _evict(self):
+        # Drop least recently used entries until the cache is back under 90% of its budget.
+        target = self.max_bytes * 0.9
+        rows = self._db.execute('SELECT key, size FROM responses ORDER BY accessed_at')
+        evicted = []
+        for key, size in rows:
+            if self._total_bytes <= target:
+                break
+            evicted.append((key,))
+            self._total_bytes -= size
+        self._db.executemany('DELETE FROM responses WHERE key = ?', evicted)
+
+    def clear(self):
+        with self._lock:
+            self._db.execute('DELETE FROM responses')
+            self._total_bytes = 0
@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+
+# Reusable client for the AKM API.
+# One pooled `requests` session is shared by every call, 429/5xx responses are
+# retried with exponential backoff, and the `*_async` methods let asyncio code
+# fetch many resources concurrently with a cap on in-flight requests.
+# Pass a `ResponseCache` (see akm_cache.py) to serve repeated metadata lookups
+# from disk. After `authenticate()`, an expired token (401) is refreshed once
+# and the request resent.
+# Requests, retries and token fetches are traced when TRACE_FILE is set (see
+# tracing.py).
+# User needs to install `requests`
+
+import asyncio
+import json
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import urljoin
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import tracing
+
+DOMAIN = 'https://api.7parkdata.com/'
+HEADER = {'content-type': 'application/json'}
+RETRY_STATUSES = frozenset([429, 500, 502, 503, 504])
+
+
+def time_series_params(metric_id, entity_id, metric_periodicity, country_name=''):
+    payload = {'entity_id': entity_id,
+               'metric_periodicity': metric_periodicity,
+               'metric_id': metric_id}
+    if country_name:
+        payload['country_name'] = country_name
+    return payload
+
+
+class AkmApiError(Exception):
+
+    def __init__(self, response):
+        self.status_code = response.status_code
+        self.content = response.content
+        super().__init__('AKM API request to %s failed with status %s' % (response.url, response.status_code))
+
+
+class AkmClient:
+
+    def __init__(self, token=None, domain=DOMAIN, max_concurrency=16, max_retries=5,
+                 backoff=0.5, max_backoff=30.0, timeout=30.0, cache=None):
+        self.domain = domain
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.cache = cache
+
+        # Size the connection pool to the concurrency cap so concurrent calls
+        # reuse kept-alive connections instead of opening new ones.
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update(HEADER)
+        if token:
+            self.set_token(token)
+        self._credentials = None
+        self._token_lock = threading.Lock()
+        self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        self.session.close()
+
+    def set_token(self, token):
+        self.session.headers['Authorization'] = 'Bearer ' + token
+
+    def authenticate(self, client_id, client_secret):
+        with tracing.span('akm.authenticate'):
+            tracing.count('akm.token_fetch')
+            payload = {'client_id': client_id, 'client_secret': client_secret}
+            response = self.request('POST', 'oauth/token', data=json.dumps(payload))
+            if response.status_code != 200:
+                raise AkmApiError(response)
+            token = response.json()['access_token']
+            self.set_token(token)
+            self._credentials = (client_id, client_secret)
+            return token
+
+    def _refresh_token(self, expired_authorization):
+        with self._token_lock:
+            # Requests that failed together refresh once; the others just resend.
+            if self.session.headers.get('Authorization') == expired_authorization:
+                with tracing.span('akm.token_refresh'):
+                    tracing.count('akm.token_refresh')
+                    self.authenticate(*self._credentials)
+
+    # Low level request handling
+
+    def _send(self, method, path, params=None, data=None, headers=None):
+        authorization = self.session.headers.get('Authorization')
+        with tracing.span('akm.send', method=method, path=path) as span:
+            response = self.session.request(method, urljoin(self.domain, path), params=params, data=data,
+                                            headers=headers, timeout=self.timeout)
+            span.set(status=response.status_code)
+        if response.status_code == 401 and self._credentials and path != 'oauth/token':
+            self._refresh_token(authorization)
+            with tracing.span('akm.send', method=method, path=path, after_refresh=True) as span:
+                response = self.session.request(method, urljoin(self.domain, path), params=params, data=data,
+                                                headers=headers, timeout=self.timeout)
+                span.set(status=response.status_code)
+        return response
+
+    def _retry_delay(self, attempt, response):
+        retry_after = response.headers.get('Retry-After')
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), self.max_backoff)
+        delay = min(self.backoff * 2 ** attempt, self.max_backoff)
+        # Jitter spreads out retries of requests that failed together.
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def request(self, method, path, params=None, data=None, headers=None):
+        attempt = 0
+        while True:
+            response = self._send(method, path, params, data, headers)
+            if response.status_code not in RETRY_STATUSES or attempt >= self.max_retries:
+                return response
+            tracing.count('akm.retry')
+            with tracing.span('akm.backoff', status=response.status_code, attempt=attempt):
+                time.sleep(self._retry_delay(attempt, response))
+            attempt += 1
+
+    def _cache_lookup(self, path, params):
+        if self.cache is None:
+            return None, None, None
+        ttl = self.cache.ttl_for(path)
+        if ttl is None:
+            return None, None, None
+        key = self.cache.key(urljoin(self.domain, path), params)
+        return key, ttl, self.cache.get(key)
+
+    def _handle_json_response(self, response, key, ttl, entry):
+        if response.status_code == 304 and entry is not None:
+            tracing.count('akm.cache_revalidated')
+            self.cache.refresh(key, ttl)
+            return json.loads(entry.body)
+        if response.status_code != 200:
+            raise AkmApiError(response)
+        if key is not None:
+            self.cache.put(key, response.content, ttl, response.headers.get('ETag'),
+                           response.headers.get('Last-Modified'))
+        return response.json()
+
+    def get_json(self, path, params=None):
+        key, ttl, entry = self._cache_lookup(path, params)
+        if entry is not None and entry.fresh:
+            tracing.count('akm.cache_hit')
+            return json.loads(entry.body)
+        response = self.request('GET', path, params=params, headers=entry.validators() if entry else None)
+        return self._handle_json_response(response, key, ttl, entry)
+
+    def _get_executor(self):
+        # The executor bounds the number of requests in flight at any moment.
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency,
+                                                thread_name_prefix='akm-client')
+        return self._executor
+
+    async def request_async(self, method, path, params=None, data=None, headers=None):
+        loop = asyncio.get_running_loop()
+        attempt = 0
+        while True:
+            response = await loop.run_in_executor(self._get_executor(), self._send, method, path, params, data,
+                                                  headers)
+            if response.status_code not in RETRY_STATUSES or attempt >= self.max_retries:
+                return response
+            tracing.count('akm.retry')
+            # Back off on the event loop so a waiting retry does not hold a pool slot.
+            with tracing.span('akm.backoff', status=response.status_code, attempt=attempt):
+                await asyncio.sleep(self._retry_delay(attempt, response))
+            attempt += 1
+
+    async def get_json_async(self, path, params=None):
+        key, ttl, entry = self._cache_lookup(path, params)
+        if entry is not None and entry.fresh:
+            tracing.count('akm.cache_hit')
+            return json.loads(entry.body)
+        response = await self.request_async('GET', path, params=params,
+                                            headers=entry.validators() if entry else None)
+        return self._handle_json_response(response, key, ttl, entry)
+
+    # AKM endpoints
+
+    @staticmethod
+    def _entity_path(company_id, metric_id, entity_id, resource):
+        return 'company/%s/metric/%s/entity/%s/%s' % (company_id, metric_id, entity_id, resource)
+
+    def companies(self, search):
+        return self.get_json('companies', {'search': search})
+
+    def company_metrics(self, company_id):
+        return self.get_json('company/%s/metrics' % company_id)
+
+    def metric_entities(self, company_id, metric_id):
+        return self.get_json('company/%s/metric/%s/entities' % (company_id, metric_id))
+
+    def queries(self, company_id, metric_id, entity_id):
+        return self.get_json(self._entity_path(company_id, metric_id, entity_id, 'queries'))
+
+    def time_series(self, metric_id, entity_id, metric_periodicity, country_name=''):
+        return self.get_json('data', time_series_params(metric_id, entity_id, metric_periodicity, country_name))
+
+    def forecasts(self, search):
+        return self.get_json('forecasts', {'search': search})
+
+    def forecast(self, company_id, metric_id, entity_id):
+        return self.get_json(self._entity_path(company_id, metric_id, entity_id, 'forecast'))
+
+    def forecast_history(self, company_id, metric_id, entity_id):
+        return self.get_json(self._entity_path(company_id, metric_id, entity_id, 'forecast/history'))
+
+    def forecast_snapshot(self, company_id, metric_id, entity_id, data_through=None):
+        params = {'data_through': data_through} if data_through else None
+        return self.get_json(self._entity_path(company_id, metric_id, entity_id, 'forecast/snapshot'), params)
+
+    async def companies_async(self, search):
+        return await self.get_json_async('companies', {'search': search})
+
+    async def company_metrics_async(self, company_id):
+        return await self.get_json_async('company/%s/metrics' % company_id)
+
+    async def metric_entities_async(self, company_id, metric_id):
+        return await self.get_json_async('company/%s/metric/%s/entities' % (company_id, metric_id))
+
+    async def queries_async(self, company_id, metric_id, entity_id):
+        return await self.get_json_async(self._entity_path(company_id, metric_id, entity_id, 'queries'))
+
+    async def time_series_async(self, metric_id, entity_id, metric_periodicity, country_name=''):
+        return await self.get_json_async('data', time_series_params(metric_id, entity_id, metric_periodicity,
+                                                                     country_name))
+
+    async def forecasts_async(self, search):
+        return await self.get_json_async('forecasts', {'search': search})
+
+    async def forecast_async(self, company_id, metric_id, entity_id):
+        return await self.get_json_async(self._entity_path(company_id, metric_id, entity_id, 'forecast'))
+
+    async def forecast_history_async(self, company_id, metric_id, entity_id):
+        return await self.get_json_async(self._entity_path(company_id, metric_id, entity_id, 'forecast/history'))
+
+    async def forecast_snapshot_async(self, company_id, metric_id, entity_id, data_through=None):
+        params = {'data_through': data_through} if data_through else None
+        return await self.get_json_async(self._entity_path(company_id, metric_id, entity_id, 'forecast/snapshot'),
+                                         params)
+
+    # Bulk fetching
+
+    def imap_unordered(self, func, arg_tuples, window=64):
+        """Yield (args, result) for func(*args) over arg_tuples, fetching concurrently.
+
+        At most `window` results are held at once: a new call is only submitted
+        after an earlier result has been handed to the caller. AkmApiError is
+        yielded in place of the result for calls that fail.
+        """
+        arg_tuples = iter(arg_tuples)
+        executor = self._get_executor()
+        pending = {}
+        while True:
+            for args in arg_tuples:
+                pending[executor.submit(func, *args)] = args
+                if len(pending) >= window:
+                    break
+            if not pending:
+                return
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                args = pending.pop(future)
+                try:
+                    yield args, future.result()
+                except AkmApiError as e:
+                    yield args, e
+
+    # Tree traversal
+
+    async def fetch_tree_async(self, company_ids):
+        async def fetch_metric(company_id, metric):
+            entities = await self.metric_entities_async(company_id, metric['metric_id'])
+            return dict(metric, entities=entities['results'])
+
+        async def fetch_company(company_id):
+            metrics = await self.company_metrics_async(company_id)
+            fetched = await asyncio.gather(*(fetch_metric(company_id, m) for m in metrics['results']))
+            return {'company_id': company_id, 'metrics': list(fetched)}
+
+        return list(await asyncio.gather(*(fetch_company(c) for c in company_ids)))
+
+    def fetch_tree(self, company_ids):
+        """Fetch the company -> metric -> entity tree for every company id concurrently."""
+        return asyncio.run(self.fetch_tree_async(company_ids))
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+
+# Compare serial and concurrent fetch of N entities against a local stub AKM server.
+# User needs to install `requests`
+#
+# Example:
+#   python akm_client_benchmark.py --entities 500 --latency 0.02 --concurrency 32
+
+import argparse
+import asyncio
+import time
+
+import requests
+
+from akm_client import AkmClient
+from akm_stub_server import StubAkmServer
+
+
+def entity_ids(n):
+    return ['e%d' % i for i in range(n)]
+
+
+def fetch_unpooled(url, entities):
+    # What the interactive script used to do: one fresh connection per call.
+    for entity_id in entities:
+        response = requests.get(url + 'data', params={'metric_id': 'm', 'entity_id': entity_id,
+                                                      'metric_periodicity': 'Monthly'})
+        response.raise_for_status()
+
+
+def fetch_pooled(client, entities):
+    for entity_id in entities:
+        client.time_series('m', entity_id, 'Monthly')
+
+
+def fetch_concurrent(client, entities):
+    async def fetch_all():
+        return await asyncio.gather(*(client.time_series_async('m', e, 'Monthly') for e in entities))
+    asyncio.run(fetch_all())
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare serial and concurrent AKM fetches against a stub server.')
+    parser.add_argument('--entities', type=int, default=200, help='number of entities to fetch')
+    parser.add_argument('--latency', type=float, default=0.01, help='stub server latency per request, seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests answered with 429')
+    parser.add_argument('--concurrency', type=int, default=16, help='max in-flight requests for the async run')
+    args = parser.parse_args()
+
+    entities = entity_ids(args.entities)
+    with StubAkmServer(latency=args.latency, error_rate=args.error_rate) as server:
+        results = []
+        if not args.error_rate:
+            results.append(('serial, new connection per call', timed(fetch_unpooled, server.url, entities)))
+        with AkmClient(token='stub', domain=server.url, max_concurrency=args.concurrency, backoff=0.01) as client:
+            results.append(('serial, pooled session', timed(fetch_pooled, client, entities)))
+            results.append(('concurrent (%d in flight)' % args.concurrency,
+                            timed(fetch_concurrent, client, entities)))
+
+    baseline = results[0][1]
+    print('%-36s %10s %12s %8s' % ('mode', 'seconds', 'entities/s', 'speedup'))
+    for name, seconds in results:
+        print('%-36s %10.3f %12.1f %7.1fx' % (name, seconds, args.entities / seconds, baseline / seconds))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+
+# Local stand-in for the AKM API, used by the benchmarks in this directory.
+# It serves a synthetic company -> metric -> entity tree with the same JSON
+# shapes as the real endpoints, and can add latency and 429 responses.
+# Responses carry an ETag and honour If-None-Match. With a token_ttl, issued
+# tokens expire and GETs without a live token are answered with 401.
+
+import hashlib
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+ENTITY_PATH = re.compile(r'^/company/(?P<company_id>[^/]+)/metric/(?P<metric_id>[^/]+)/entity/(?P<entity_id>[^/]+)/'
+                         r'(?P<resource>queries|forecast|forecast/history|forecast/snapshot)$')
+ENTITIES_PATH = re.compile(r'^/company/(?P<company_id>[^/]+)/metric/(?P<metric_id>[^/]+)/entities$')
+METRICS_PATH = re.compile(r'^/company/(?P<company_id>[^/]+)/metrics$')
+
+
+class StubAkmData:
+
+    def __init__(self, metrics_per_company=3, entities_per_metric=5, points_per_series=24):
+        self.metrics_per_company = metrics_per_company
+        self.entities_per_metric = entities_per_metric
+        self.points_per_series = points_per_series
+
+    def companies(self, search):
+        return {'results': [{'company_name': '%s %s' % (search, i), 'company_id': 'c%d' % i} for i in range(3)]}
+
+    def metrics(self, company_id):
+        return {'results': [{'metric_name': 'Metric %d' % i, 'metric_id': '%s-m%d' % (company_id, i),
+                             'metric_description': 'Synthetic metric %d' % i}
+                            for i in range(self.metrics_per_company)]}
+
+    def entities(self, company_id, metric_id):
+        return {'results': [{'entity_name': 'Entity %d' % i, 'entity_id': '%s-e%d' % (metric_id, i)}
+                            for i in range(self.entities_per_metric)]}
+
+    def series(self, metric_id, entity_id, metric_periodicity):
+        first = date(2015, 1, 1)
+        data = []
+        for i in range(self.points_per_series):
+            day = (first + timedelta(days=31 * i)).replace(day=1)
+            data.append({'date': day.isoformat(), 'value': float(i), 'metric_id': metric_id,
+                         'entity_id': entity_id, 'metric_periodicity': metric_periodicity})
+        return {'data': data}
+
+    def entity_resource(self, company_id, metric_id, entity_id, resource, data_through=None):
+        if resource == 'queries':
+            return {'queries': [{'query': 'synthetic', 'entity_id': entity_id}]}
+        series = self.series(metric_id, entity_id, 'Monthly')['data']
+        if resource == 'forecast':
+            return {'forecast_metric_name': 'Metric', 'data': series[-3:]}
+        if resource == 'forecast/history':
+            return {'description': 'Synthetic forecast history', 'data': series}
+        snapshots = [{'data_through': row['date'], 'forecast': row['value'] + 0.5} for row in series]
+        if data_through:
+            snapshots = [s for s in snapshots if s['data_through'] > data_through]
+        return {'company_id': company_id, 'metric_id': metric_id, 'entity_id': entity_id, 'data': snapshots}
+
+
+class StubHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # The listen backlog is set when the server is created, so it has to be a class attribute.
+    request_queue_size = 128
+
+
+def make_handler(data, latency=0.0, error_rate=0.0, token_ttl=None):
+    token_numbers = itertools.count()
+    token_expiry = {}
+
+    class StubAkmHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def _reply(self, status, body, headers=None):
+            payload = json.dumps(body).encode('utf-8')
+            if status == 200:
+                etag = '"%s"' % hashlib.md5(payload).hexdigest()
+                if self.headers.get('If-None-Match') == etag:
+                    status, payload = 304, b''
+                headers = dict(headers or {}, ETag=etag)
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def _route(self, path, query):
+            if path == '/companies':
+                return data.companies(query.get('search', ''))
+            if path == '/forecasts':
+                return {'results': data.companies(query.get('search', ''))['results']}
+            if path == '/data':
+                return data.series(query['metric_id'], query['entity_id'], query['metric_periodicity'])
+            match = METRICS_PATH.match(path)
+            if match:
+                return data.metrics(match.group('company_id'))
+            match = ENTITIES_PATH.match(path)
+            if match:
+                return data.entities(match.group('company_id'), match.group('metric_id'))
+            match = ENTITY_PATH.match(path)
+            if match:
+                return data.entity_resource(data_through=query.get('data_through'), **match.groupdict())
+            return None
+
+        def do_GET(self):
+            if latency:
+                time.sleep(latency)
+            if error_rate and random.random() < error_rate:
+                self._reply(429, {'error': 'rate limited'}, {'Retry-After': '0'})
+                return
+            if token_ttl is not None:
+                token = self.headers.get('Authorization', '')[len('Bearer '):]
+                if token_expiry.get(token, 0) < time.monotonic():
+                    self._reply(401, {'error': 'invalid or expired token'})
+                    return
+            parsed = urlparse(self.path)
+            query = {k: v[-1] for k, v in parse_qs(parsed.query).items()}
+            body = self._route(parsed.path, query)
+            if body is None:
+                self._reply(404, {'error': 'not found'})
+            else:
+                self._reply(200, body)
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            token = 'stub-token-%d' % next(token_numbers)
+            if token_ttl is not None:
+                token_expiry[token] = time.monotonic() + token_ttl
+            self._reply(200, {'access_token': token})
+
+    return StubAkmHandler
+
+
+class StubAkmServer:
+    """Run the stub AKM API on a background thread; usable as a context manager."""
+
+    def __init__(self, data=None, latency=0.0, error_rate=0.0, token_ttl=None, host='127.0.0.1', port=0):
+        self.httpd = StubHTTPServer((host, port), make_handler(data or StubAkmData(), latency, error_rate,
+                                                               token_ttl))
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return 'http://%s:%s/' % (host, port)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.httpd.shutdown()
+        self.httpd.server_close()
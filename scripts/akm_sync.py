@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+
+# Incremental sync of AKM time series and forecast snapshots into a local SQLite store.
+# For every series the store records a high-water mark (latest period for time
+# series, latest data_through for forecast snapshots). Forecast snapshots are
+# requested with data_through, so each run only downloads newer snapshots.
+# The documented /data endpoint has no date filter, so by default every run
+# downloads each series' full history and drops points at or before the mark
+# client side; only the store writes are incremental. If your API deployment
+# accepts a start-date query parameter, name it with --series-start-param to
+# send the mark with each /data request. Either way deltas are merged with
+# upserts, so re-running a sync, or receiving overlapping data, never
+# duplicates points.
+# User needs to install `requests`
+#
+# Example:
+#   python akm_sync.py akm_store.sqlite --series series.csv --forecasts forecasts.csv
+#
+# series.csv has a metric_id,entity_id,metric_periodicity,country_name header
+# (see time_series_export.py), forecasts.csv a company_id,metric_id,entity_id header.
+
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import time
+
+import tracing
+from akm_client import DOMAIN, AkmApiError, AkmClient, time_series_params
+
+SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS series_points ('
+    'metric_id TEXT NOT NULL, entity_id TEXT NOT NULL, metric_periodicity TEXT NOT NULL, '
+    'country_name TEXT NOT NULL, date TEXT NOT NULL, value REAL, row TEXT NOT NULL, '
+    'PRIMARY KEY (metric_id, entity_id, metric_periodicity, country_name, date))',
+    'CREATE TABLE IF NOT EXISTS forecast_snapshots ('
+    'company_id TEXT NOT NULL, metric_id TEXT NOT NULL, entity_id TEXT NOT NULL, '
+    'data_through TEXT NOT NULL, snapshot TEXT NOT NULL, '
+    'PRIMARY KEY (company_id, metric_id, entity_id, data_through))',
+    'CREATE TABLE IF NOT EXISTS high_water_marks ('
+    'kind TEXT NOT NULL, series_key TEXT NOT NULL, high_water TEXT NOT NULL, synced_at REAL NOT NULL, '
+    'PRIMARY KEY (kind, series_key))',
+]
+
+
+def series_key(key):
+    return json.dumps(list(key))
+
+
+def snapshot_rows(json_response):
+    if isinstance(json_response, list):
+        return json_response
+    return json_response.get('data', [])
+
+
+class SyncStore:
+
+    def __init__(self, path):
+        self.db = sqlite3.connect(path)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        for statement in SCHEMA:
+            self.db.execute(statement)
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+    def high_water_marks(self, kind):
+        rows = self.db.execute('SELECT series_key, high_water FROM high_water_marks WHERE kind = ?', (kind,))
+        return {tuple(json.loads(k)): v for k, v in rows}
+
+    def _advance(self, kind, key, high_water):
+        self.db.execute('INSERT INTO high_water_marks VALUES (?, ?, ?, ?) '
+                        'ON CONFLICT (kind, series_key) DO UPDATE SET '
+                        'high_water = MAX(high_water, excluded.high_water), synced_at = excluded.synced_at',
+                        (kind, series_key(key), high_water, time.time()))
+
+    def merge_series(self, key, rows, high_water=None, date_field='date', value_field='value'):
+        rows = [r for r in rows if high_water is None or str(r[date_field]) > high_water]
+        if not rows:
+            return 0
+        with tracing.span('sync.merge_series', rows=len(rows)), self.db:
+            self.db.executemany(
+                'INSERT INTO series_points VALUES (?, ?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT (metric_id, entity_id, metric_periodicity, country_name, date) DO UPDATE SET '
+                'value = excluded.value, row = excluded.row',
+                [key + (str(r[date_field]), r.get(value_field), json.dumps(r, sort_keys=True)) for r in rows])
+            self._advance('series', key, max(str(r[date_field]) for r in rows))
+        return len(rows)
+
+    def merge_snapshots(self, key, snapshots, high_water=None):
+        snapshots = [s for s in snapshots if high_water is None or str(s['data_through']) > high_water]
+        if not snapshots:
+            return 0
+        with tracing.span('sync.merge_snapshots', snapshots=len(snapshots)), self.db:
+            self.db.executemany(
+                'INSERT INTO forecast_snapshots VALUES (?, ?, ?, ?, ?) '
+                'ON CONFLICT (company_id, metric_id, entity_id, data_through) DO UPDATE SET '
+                'snapshot = excluded.snapshot',
+                [key + (str(s['data_through']), json.dumps(s, sort_keys=True)) for s in snapshots])
+            self._advance('forecast', key, max(str(s['data_through']) for s in snapshots))
+        return len(snapshots)
+
+
+def sync_series(client, store, series, window=64, start_param=None):
+    """Merge new points of every series; `start_param` names a /data date filter to send the mark in, if any."""
+    marks = store.high_water_marks('series')
+
+    def fetch(metric_id, entity_id, metric_periodicity, country_name):
+        params = time_series_params(metric_id, entity_id, metric_periodicity, country_name)
+        high_water = marks.get((metric_id, entity_id, metric_periodicity, country_name))
+        if high_water and start_param:
+            params[start_param] = high_water
+        return client.get_json('data', params)
+
+    new_points = 0
+    for key, json_response in client.imap_unordered(fetch, series, window):
+        if isinstance(json_response, AkmApiError):
+            print('Skipping series %s: %s' % (key, json_response))
+            continue
+        new_points += store.merge_series(key, json_response['data'], marks.get(key))
+    return new_points
+
+
+def sync_forecasts(client, store, triples, window=64):
+    marks = store.high_water_marks('forecast')
+
+    def fetch(company_id, metric_id, entity_id):
+        return client.forecast_snapshot(company_id, metric_id, entity_id,
+                                        marks.get((company_id, metric_id, entity_id)))
+
+    new_snapshots = 0
+    for key, json_response in client.imap_unordered(fetch, triples, window):
+        if isinstance(json_response, AkmApiError):
+            print('Skipping forecast %s: %s' % (key, json_response))
+            continue
+        new_snapshots += store.merge_snapshots(key, snapshot_rows(json_response), marks.get(key))
+    return new_snapshots
+
+
+def read_csv(path, columns):
+    with open(path, newline='') as f:
+        for row in csv.DictReader(f):
+            yield tuple(row.get(c) or '' for c in columns)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Incrementally sync AKM time series and forecast snapshots.')
+    parser.add_argument('store', help='path of the local SQLite store')
+    parser.add_argument('--series', help='CSV of metric_id,entity_id,metric_periodicity,country_name')
+    parser.add_argument('--forecasts', help='CSV of company_id,metric_id,entity_id')
+    parser.add_argument('--series-start-param', metavar='NAME',
+                        help='/data query parameter filtering points by start date, if the API supports one; '
+                             'default: download full series and filter locally')
+    parser.add_argument('--concurrency', type=int, default=16, help='max in-flight requests')
+    parser.add_argument('--domain', default=DOMAIN)
+    parser.add_argument('--client-id', default=os.environ.get('AKM_CLIENT_ID', ''))
+    parser.add_argument('--client-secret', default=os.environ.get('AKM_CLIENT_SECRET', ''))
+    args = parser.parse_args()
+
+    store = SyncStore(args.store)
+    with AkmClient(domain=args.domain, max_concurrency=args.concurrency) as client:
+        try:
+            client.authenticate(args.client_id, args.client_secret)
+        except AkmApiError:
+            print('Cannot get token with given client id and secret. Aborting......')
+            exit(1)
+        if args.series:
+            series = ((m, e, p.title(), c) for m, e, p, c in
+                      read_csv(args.series, ('metric_id', 'entity_id', 'metric_periodicity', 'country_name')))
+            new_points = sync_series(client, store, series, start_param=args.series_start_param)
+            print('New time series points: %d' % new_points)
+        if args.forecasts:
+            triples = read_csv(args.forecasts, ('company_id', 'metric_id', 'entity_id'))
+            print('New forecast snapshots: %d' % sync_forecasts(client, store, triples))
+    store.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+
+# Compact, versioned local store of AKM forecast snapshots.
+# Consecutive snapshots of a forecast differ in only a few points, so for
+# every (company_id, metric_id, entity_id) the store keeps its first snapshot
+# in full and, for each later data_through, only the points that changed (a
+# removed point is kept as a null). Points are held column-wise in NumPy
+# arrays sorted by series, forecast target and data_through, and saved as one
+# dictionary-encoded Parquet file.
+#
+# Reconstructing every forecast as of a date, or comparing two dates across
+# all entities, is then a handful of array operations instead of parsing
+# every stored JSON snapshot.
+# User needs to install `requests`, `numpy` and `pyarrow`
+#
+# A snapshot is flattened into (target, value) points: top-level numeric
+# fields are targets named after the field (e.g. `forecast`), and lists of
+# rows with a `date` are targets named `<field>:<date>` (e.g. `data:2020-06-01`).
+#
+# Examples:
+#   python forecast_store.py import akm_store.sqlite forecasts.parquet
+#   python forecast_store.py as-of forecasts.parquet 2020-06-30 --csv forecast_2020-06-30.csv
+#   python forecast_store.py revisions forecasts.parquet 2020-03-31 2020-06-30 --top 20
+
+import argparse
+import csv
+import json
+import sqlite3
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+KEY_COLUMNS = ('company_id', 'metric_id', 'entity_id')
+
+
+def to_day(data_through):
+    return np.datetime64(str(data_through)[:10], 'D')
+
+
+def snapshot_points(snapshot, date_field='date', value_field='value'):
+    """Flatten a snapshot dict into {target: value}; None values are dropped."""
+    points = {}
+    for field, value in snapshot.items():
+        if field == 'data_through':
+            continue
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            points[field] = float(value)
+        elif isinstance(value, list):
+            for row in value:
+                if isinstance(row, dict) and date_field in row and row.get(value_field) is not None:
+                    points['%s:%s' % (field, row[date_field])] = float(row[value_field])
+    return points
+
+
+class _Codes:
+
+    def __init__(self, values=()):
+        self.values = list(values)
+        self.codes = {v: i for i, v in enumerate(self.values)}
+
+    def code(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+
+class ForecastStore:
+
+    def __init__(self):
+        self.series_keys = _Codes()
+        self.targets = _Codes()
+        self.series = np.empty(0, dtype=np.int32)
+        self.target = np.empty(0, dtype=np.int32)
+        self.data_through = np.empty(0, dtype='datetime64[D]')
+        self.value = np.empty(0, dtype=np.float64)
+        # series code -> delta rows not yet merged into the sorted arrays.
+        self._pending = {}
+        # Series whose rows in the sorted arrays are replaced by their pending rows.
+        self._stale = set()
+        # series code -> (latest data_through, {target code: value}) for computing deltas;
+        # filled lazily for series loaded from a file.
+        self._latest = {}
+
+    def __len__(self):
+        self._consolidate()
+        return len(self.value)
+
+    # Writing
+
+    def add_snapshots(self, key, snapshots):
+        """Add the snapshots of one (company_id, metric_id, entity_id); return the number of delta rows."""
+        series = self.series_keys.code(tuple(key))
+        versions = sorted(((to_day(s['data_through']), snapshot_points(s)) for s in snapshots),
+                          key=lambda version: version[0])
+        if not versions:
+            return 0
+        latest = self._latest.get(series)
+        if latest is None:
+            latest = self._stored_latest(series)
+        if latest is not None and versions[0][0] <= latest[0]:
+            # An older or repeated data_through: rebuild this series' deltas from all of its versions.
+            # The old rows are dropped at the next consolidation, together with those of other rebuilt series.
+            versions = self._merge_versions(series, versions)
+            self._stale.add(series)
+            self._pending[series] = []
+            latest = None
+        previous = latest[1] if latest else {}
+        rows = []
+        for day, points in versions:
+            current = {self.targets.code(target): value for target, value in points.items()}
+            for target, value in current.items():
+                if previous.get(target) != value:
+                    rows.append((series, target, day, value))
+            for target in previous.keys() - current.keys():
+                rows.append((series, target, day, np.nan))
+            previous = current
+        self._latest[series] = (versions[-1][0], previous)
+        self._pending.setdefault(series, []).extend(rows)
+        return len(rows)
+
+    def _stored_latest(self, series):
+        # Rows of series without a _latest entry are all in the sorted arrays.
+        rows = self._series_rows(series)
+        versions = list(self._versions(self.target[rows], self.data_through[rows], self.value[rows]))
+        if not versions:
+            return None
+        day, state = versions[-1]
+        return day, {self.targets.codes[target]: value for target, value in state.items()}
+
+    def _merge_versions(self, series, versions):
+        # Stored versions of the series, from the sorted arrays (unless superseded) and its pending rows.
+        rows = np.empty(0, dtype=np.int64) if series in self._stale else self._series_rows(series)
+        pending = self._pending.get(series, [])
+        targets = np.concatenate([self.target[rows], np.array([r[1] for r in pending], dtype=np.int32)])
+        days = np.concatenate([self.data_through[rows], np.array([r[2] for r in pending], dtype='datetime64[D]')])
+        values = np.concatenate([self.value[rows], np.array([r[3] for r in pending], dtype=np.float64)])
+        merged = {day: points for day, points in self._versions(targets, days, values)}
+        merged.update((day, points) for day, points in versions)
+        return sorted(merged.items(), key=lambda version: version[0])
+
+    def _consolidate(self):
+        if self._stale:
+            keep = ~np.isin(self.series, np.fromiter(self._stale, dtype=np.int32))
+            self.series, self.target = self.series[keep], self.target[keep]
+            self.data_through, self.value = self.data_through[keep], self.value[keep]
+            self._stale = set()
+        rows = [row for series_rows in self._pending.values() for row in series_rows]
+        self._pending = {}
+        if not rows:
+            return
+        series, target, day, value = zip(*rows)
+        self.series = np.concatenate([self.series, np.array(series, dtype=np.int32)])
+        self.target = np.concatenate([self.target, np.array(target, dtype=np.int32)])
+        self.data_through = np.concatenate([self.data_through, np.array(day, dtype='datetime64[D]')])
+        self.value = np.concatenate([self.value, np.array(value, dtype=np.float64)])
+        order = np.lexsort((self.data_through, self.target, self.series))
+        self.series, self.target = self.series[order], self.target[order]
+        self.data_through, self.value = self.data_through[order], self.value[order]
+
+    # Reading
+
+    def _group_ends(self, mask):
+        """Indices of the last row of each (series, target) group among the rows selected by mask."""
+        rows = np.flatnonzero(mask)
+        group = self.series[rows].astype(np.int64) * len(self.targets.values) + self.target[rows]
+        return rows[np.concatenate((group[1:] != group[:-1], [True]))] if len(rows) else rows
+
+    def as_of(self, data_through):
+        """Return (series, target, value) arrays of every forecast point as known on data_through."""
+        self._consolidate()
+        rows = self._group_ends(self.data_through <= to_day(data_through))
+        rows = rows[~np.isnan(self.value[rows])]
+        return self.series[rows], self.target[rows], self.value[rows]
+
+    def _series_rows(self, series):
+        start, end = np.searchsorted(self.series, [series, series + 1])
+        return np.arange(start, end)
+
+    def latest_data_through(self):
+        """Return {(company_id, metric_id, entity_id): latest stored data_through} of every series."""
+        self._consolidate()
+        if not len(self.series):
+            return {}
+        starts = np.flatnonzero(np.concatenate(([True], self.series[1:] != self.series[:-1])))
+        latest = np.maximum.reduceat(self.data_through, starts)
+        return {self.series_keys.values[series]: day for series, day in zip(self.series[starts], latest)}
+
+    def series_versions(self, series):
+        """Yield (data_through, {target: value}) for every stored version of one series code."""
+        self._consolidate()
+        rows = self._series_rows(series)
+        return self._versions(self.target[rows], self.data_through[rows], self.value[rows])
+
+    def _versions(self, targets, days, values):
+        state = {}
+        for day in np.unique(days):
+            changed = days == day
+            for target, value in zip(targets[changed], values[changed]):
+                if np.isnan(value):
+                    state.pop(self.targets.values[target], None)
+                else:
+                    state[self.targets.values[target]] = float(value)
+            yield day, dict(state)
+
+    def snapshot(self, key, data_through):
+        """Return {target: value} of one series as of data_through."""
+        series = self.series_keys.codes.get(tuple(key))
+        points = {}
+        if series is None:
+            return points
+        for day, state in self.series_versions(series):
+            if day > to_day(data_through):
+                break
+            points = state
+        return points
+
+    def compare(self, before, after):
+        """Compare forecasts as of two dates for every point known at either.
+
+        Returns (series, target, value before, value after) arrays; a point
+        missing on one of the dates is NaN there.
+        """
+        width = len(self.targets.values)
+        a_series, a_target, a_value = self.as_of(before)
+        b_series, b_target, b_value = self.as_of(after)
+        a_key = a_series.astype(np.int64) * width + a_target
+        b_key = b_series.astype(np.int64) * width + b_target
+        keys = np.union1d(a_key, b_key)
+        values_before = np.full(len(keys), np.nan)
+        values_after = np.full(len(keys), np.nan)
+        values_before[np.searchsorted(keys, a_key)] = a_value
+        values_after[np.searchsorted(keys, b_key)] = b_value
+        return (keys // width).astype(np.int32), (keys % width).astype(np.int32), values_before, values_after
+
+    def revisions(self):
+        """Return (series, target, data_through, previous value, value) of every revised point.
+
+        The first version of each point is not a revision; a removed point has value NaN.
+        """
+        self._consolidate()
+        same = np.concatenate(([False], (self.series[1:] == self.series[:-1]) &
+                                        (self.target[1:] == self.target[:-1])))
+        previous = np.concatenate(([np.nan], self.value[:-1]))
+        rows = np.flatnonzero(same)
+        return self.series[rows], self.target[rows], self.data_through[rows], previous[rows], self.value[rows]
+
+    def key(self, series):
+        return self.series_keys.values[series]
+
+    def target_name(self, target):
+        return self.targets.values[target]
+
+    # Persistence
+
+    def save(self, path):
+        self._consolidate()
+        keys = np.array(self.series_keys.values, dtype=object).reshape(-1, len(KEY_COLUMNS))
+        columns = {}
+        for i, name in enumerate(KEY_COLUMNS):
+            labels, codes = np.unique(keys[:, i].astype(str), return_inverse=True) if len(keys) else ([], [])
+            columns[name] = pa.DictionaryArray.from_arrays(np.asarray(codes, dtype=np.int32)[self.series],
+                                                           pa.array(labels, type=pa.string()))
+        columns['target'] = pa.DictionaryArray.from_arrays(self.target, pa.array(self.targets.values,
+                                                                                type=pa.string()))
+        columns['data_through'] = pa.array(self.data_through, type=pa.date32())
+        columns['value'] = pa.array(self.value, type=pa.float64(), from_pandas=True)
+        pq.write_table(pa.table(columns), path, compression='zstd')
+
+    @classmethod
+    def load(cls, path):
+        table = pq.read_table(path, read_dictionary=KEY_COLUMNS + ('target',))
+        store = cls()
+        if not table.num_rows:
+            return store
+        codes, labels = [], []
+        for name in KEY_COLUMNS + ('target',):
+            column = table.column(name).combine_chunks()
+            codes.append(column.indices.to_numpy().astype(np.int64))
+            labels.append(column.dictionary.to_pylist())
+        key_codes = np.stack(codes[:len(KEY_COLUMNS)], axis=1)
+        unique_keys, series = np.unique(key_codes, axis=0, return_inverse=True)
+        store.series_keys = _Codes(tuple(labels[i][c] for i, c in enumerate(row)) for row in unique_keys)
+        store.targets = _Codes(labels[-1])
+        store.series = series.reshape(-1).astype(np.int32)
+        store.target = codes[-1].astype(np.int32)
+        store.data_through = table.column('data_through').to_numpy().astype('datetime64[D]')
+        store.value = table.column('value').to_numpy(zero_copy_only=False).astype(np.float64)
+        order = np.lexsort((store.data_through, store.target, store.series))
+        store.series, store.target = store.series[order], store.target[order]
+        store.data_through, store.value = store.data_through[order], store.value[order]
+        return store
+
+
+def import_sync_store(sync_path, store=None):
+    """Add the forecast snapshots of an akm_sync.py SQLite store to a ForecastStore.
+
+    Snapshots at or before a series' latest stored data_through are skipped,
+    so re-importing a store only adds what akm_sync.py fetched since.
+    """
+    if store is None:
+        store = ForecastStore()
+    marks = store.latest_data_through()
+    db = sqlite3.connect(sync_path)
+    try:
+        rows = db.execute('SELECT company_id, metric_id, entity_id, data_through, snapshot FROM forecast_snapshots '
+                          'ORDER BY company_id, metric_id, entity_id, data_through')
+        key, snapshots = None, []
+        for company_id, metric_id, entity_id, data_through, snapshot in rows:
+            if (company_id, metric_id, entity_id) != key:
+                if snapshots:
+                    store.add_snapshots(key, snapshots)
+                key, snapshots = (company_id, metric_id, entity_id), []
+                mark = marks.get(key)
+            if mark is None or to_day(data_through) > mark:
+                snapshots.append(json.loads(snapshot))
+        if snapshots:
+            store.add_snapshots(key, snapshots)
+    finally:
+        db.close()
+    return store
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compact versioned store of AKM forecast snapshots.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    import_parser = commands.add_parser('import', help='add the snapshots of an akm_sync.py store')
+    import_parser.add_argument('sync_store', help='SQLite store written by akm_sync.py')
+    import_parser.add_argument('store', help='Parquet forecast store to create or update')
+
+    as_of_parser = commands.add_parser('as-of', help='reconstruct every forecast as of a data_through date')
+    as_of_parser.add_argument('store')
+    as_of_parser.add_argument('data_through')
+    as_of_parser.add_argument('--csv', help='write the points to a CSV instead of printing them')
+
+    revisions_parser = commands.add_parser('revisions', help='largest forecast changes between two dates')
+    revisions_parser.add_argument('store')
+    revisions_parser.add_argument('before')
+    revisions_parser.add_argument('after')
+    revisions_parser.add_argument('--top', type=int, default=20)
+    args = parser.parse_args()
+
+    if args.command == 'import':
+        try:
+            store = ForecastStore.load(args.store)
+        except FileNotFoundError:
+            store = ForecastStore()
+        store = import_sync_store(args.sync_store, store)
+        store.save(args.store)
+        print('Stored %d points for %d series in %s' % (len(store), len(store.series_keys.values), args.store))
+        return
+
+    store = ForecastStore.load(args.store)
+    if args.command == 'as-of':
+        series, target, value = store.as_of(args.data_through)
+        rows = (store.key(s) + (store.target_name(t), v) for s, t, v in zip(series, target, value))
+        if args.csv:
+            with open(args.csv, 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(KEY_COLUMNS + ('target', 'value'))
+                writer.writerows(rows)
+            print('Wrote %d points to %s' % (len(value), args.csv))
+        else:
+            for row in rows:
+                print('%s\t%s\t%s\t%s\t%s' % row)
+    else:
+        series, target, before, after = store.compare(args.before, args.after)
+        change = after - before
+        for i in np.argsort(-np.abs(np.nan_to_num(change)), kind='stable')[:args.top]:
+            print('%s\t%s\t%s\t%s\t%s -> %s' % (store.key(series[i]) + (store.target_name(target[i]),
+                                                                       before[i], after[i])))
+
+
+if __name__ == '__main__':
+    main()
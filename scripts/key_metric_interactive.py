@@ -3,15 +3,17 @@
 # Interactive script to help users to traverse through AKM API
 # User needs to install `requests`
 
-import requests
-import json
-from urllib.parse import urljoin
+import os
 from pprint import pprint
 
+from akm_cache import ResponseCache
+from akm_client import AkmApiError, AkmClient
+
 CLIENT_ID = ''
 CLIENT_SECRET = ''
-DOMAIN = 'https://api.7parkdata.com/'
-HEADER = {'content-type': 'application/json'}
+# Metadata lookups (companies, metrics, entities, queries) are cached here
+# between runs. Set to '' to disable the cache.
+CACHE_PATH = os.path.join(os.path.expanduser('~'), '.cache', '7park', 'akm_cache.sqlite')
 
 
 def instruction():
@@ -32,137 +34,124 @@ def instruction():
 
 def company_name_to_id(company_name):
     print('Using company name: %s to retrieve company id' % company_name)
-    url = urljoin(DOMAIN, 'companies')
-    payload = {'search': '%s' % company_name}
-
-    response = requests.get(url, headers=headers, params=payload)
-    if response.status_code == 200:
+    try:
+        json_response = client.companies(company_name)
+    except AkmApiError as e:
+        print(e.content)
+    else:
         print('-'*40)
-        for r in response.json()['results']:
+        for r in json_response['results']:
             print("%s [%s]" % (r['company_name'], r['company_id']))
         print('-'*40)
-    else:
-        print(response.content)
 
 
 def company_id_to_metrics(company_id):
     print('Using company id: %s to retrieve metric id' % company_id)
-    url = DOMAIN + 'company/%s/metrics' % company_id
-    response = requests.get(url, headers=headers)
-    if response.status_code == 200:
+    try:
+        json_response = client.company_metrics(company_id)
+    except AkmApiError as e:
+        print(e.content)
+    else:
         print('-'*40)
-        for r in response.json()['results']:
+        for r in json_response['results']:
             print('%s [%s] -- %s' % (r['metric_name'], r['metric_id'], r['metric_description']))
         print('-'*40)
-    else:
-        print(response.content)
 
 
 def metric_id_to_entities(company_id, metric_id):
     print('Using company id: %s & metric id: %s to retrieve entity id' % (company_id, metric_id))
-    url = DOMAIN + 'company/%s/metric/%s/entities' % (company_id, metric_id)
-    response = requests.get(url, headers=headers)
-    if response.status_code == 200:
+    try:
+        json_response = client.metric_entities(company_id, metric_id)
+    except AkmApiError as e:
+        print(e.content)
+    else:
         print('-'*40)
-        for r in response.json()['results']:
+        for r in json_response['results']:
             print('%s [%s]' % (r['entity_name'], r['entity_id']))
         print('-'*40)
-    else:
-        print(response.content)
 
 
 def get_queries(company_id, metric_id, entity_id):
     print('Using company id: %s, metric id: %s, & entity id: %s to retrieve queries' %
           (company_id, metric_id, entity_id))
-    url = DOMAIN + 'company/%s/metric/%s/entity/%s/queries' % (company_id, metric_id, entity_id)
-    response = requests.get(url, headers=headers)
-    if response.status_code == 200:
+    try:
+        json_response = client.queries(company_id, metric_id, entity_id)
+    except AkmApiError as e:
+        print(e.content)
+    else:
         print('-'*40)
-        for r in response.json()['queries']:
+        for r in json_response['queries']:
             pprint(r)
         print('-'*40)
-    else:
-        print(response.content)
 
 
 def get_time_series(metric_id, entity_id, metric_periodicity, country_name=''):
     print('Using metric id: %s, & entity id: %s %s' % (metric_id, entity_id, 'and country name: %s' % country_name if country_name else ''))
-    url = DOMAIN + 'data'
-    payload = {'entity_id': entity_id,
-               'metric_periodicity': metric_periodicity,
-               'metric_id': metric_id}
-    if country_name:
-        payload['country_name'] = country_name
-    response = requests.get(url, headers=headers, params=payload)
-    if response.status_code == 200:
-        print('-'*40)
-        for r in response.json()['data']:
+    try:
+        json_response = client.time_series(metric_id, entity_id, metric_periodicity, country_name)
+    except AkmApiError as e:
+        print(e.content)
+    else:
+        print('-'*40)
+        for r in json_response['data']:
             pprint(r)
         print('-'*40)
-    else:
-        print(response.content)
 
 
 def get_forecasts(company_name):
     print('Using company_name: %s to get forecasts')
-    url = DOMAIN + 'forecasts'
-    payload = {'search': '%s' % company_name}
-    response = requests.get(url, headers=headers, params=payload)
-    if response.status_code == 200:
+    try:
+        json_response = client.forecasts(company_name)
+    except AkmApiError as e:
+        print(e.content)
+    else:
         print('-'*40)
-        for r in response.json()['results']:
+        for r in json_response['results']:
             print(r)
         print('-'*40)
-    else:
-        print(response.content)
 
 
 def get_forecast(company_id, metric_id, entity_id):
     print('Using company id: %s, metric id: %s, & entity id: %s to retrieve forecast' %
           (company_id, metric_id, entity_id))
-    url = DOMAIN + 'company/%s/metric/%s/entity/%s/forecast' % (company_id, metric_id, entity_id)
-    response = requests.get(url, headers=headers)
-    if response.status_code == 200:
-        json_response = response.json()
+    try:
+        json_response = client.forecast(company_id, metric_id, entity_id)
+    except AkmApiError as e:
+        print(e.content)
+    else:
         print('-'*40)
         print("forecast_metric_name: %s" % json_response['forecast_metric_name'])
         for r in json_response['data']:
             pprint(r)
         print('-'*40)
-    else:
-        print(response.content)
 
 
 def get_forecast_history(company_id, metric_id, entity_id):
     print('Using company id: %s, metric id: %s, & entity id: %s to retrieve forecast' %
           (company_id, metric_id, entity_id))
-    url = DOMAIN + 'company/%s/metric/%s/entity/%s/forecast/history' % (company_id, metric_id, entity_id)
-    response = requests.get(url, headers=headers)
-    if response.status_code == 200:
-        json_response = response.json()
+    try:
+        json_response = client.forecast_history(company_id, metric_id, entity_id)
+    except AkmApiError as e:
+        print(e.content)
+    else:
         print('-'*40)
         print("description: %s" % json_response['description'])
         for r in json_response['data']:
             pprint(r)
         print('-'*40)
-    else:
-        print(response.content)
 
 
 def get_forecast_snapshot(company_id, metric_id, entity_id, data_through=None):
     print('Using company id: %s, metric id: %s, & entity id: %s to retrieve forecast' %
           (company_id, metric_id, entity_id))
-    url = DOMAIN + 'company/%s/metric/%s/entity/%s/forecast/snapshot' % (company_id, metric_id, entity_id)
-    if data_through:
-        url += f'?data_through={data_through}'
-    response = requests.get(url, headers=headers)
-    if response.status_code == 200:
-        json_response = response.json()
+    try:
+        json_response = client.forecast_snapshot(company_id, metric_id, entity_id, data_through)
+    except AkmApiError as e:
+        print(e.content)
+    else:
         print('-'*40)
         pprint(json_response)
         print('-'*40)
-    else:
-        print(response.content)
 
 
 if __name__ == '__main__':
@@ -177,15 +166,10 @@ if __name__ == '__main__':
         client_id = CLIENT_ID
         client_secret = CLIENT_SECRET
 
-    token_url = urljoin(DOMAIN, 'oauth/token')
-    global headers
-    headers = HEADER
-    payload = {'client_id': client_id, 'client_secret': client_secret}
-    response = requests.post(token_url, headers=headers, data=json.dumps(payload))
-    if response.status_code == 200:
-        token = response.json()['access_token']
-        headers['Authorization'] = 'Bearer ' + token
-    else:
+    client = AkmClient(cache=ResponseCache(CACHE_PATH) if CACHE_PATH else None)
+    try:
+        client.authenticate(client_id, client_secret)
+    except AkmApiError:
         print('Cannot get token with given client id and secret. Aborting......')
         exit(1)
     selection = instruction()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+
+# Non-interactive bulk export of AKM time series (`/data` endpoint) to
+# partitioned Parquet or Arrow IPC files.
+# Responses are fetched concurrently and converted to typed record batches as
+# they arrive, so memory stays bounded by the fetch window and the batch size
+# rather than by the number of series. A record batch may span as many
+# partitions as it has rows, so partitioning by metric_id or entity_id works
+# for any number of series; past 1024 open partitions pyarrow closes the
+# least recently written file and starts a new one, so such partitions hold
+# several files.
+# The output directory must be empty or missing, so a rerun never mixes its
+# files with those of an earlier export.
+# User needs to install `requests` and `pyarrow`
+#
+# The series file is a CSV with a header row:
+#   metric_id,entity_id,metric_periodicity,country_name
+# country_name may be left empty.
+#
+# Example:
+#   python time_series_export.py series.csv export/ --format parquet --partition-by metric_periodicity
+
+import argparse
+import csv
+import os
+from datetime import date
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+import tracing
+from akm_client import DOMAIN, AkmApiError, AkmClient
+
+SCHEMA = pa.schema([
+    ('metric_id', pa.string()),
+    ('entity_id', pa.string()),
+    ('metric_periodicity', pa.string()),
+    ('country_name', pa.string()),
+    ('date', pa.date32()),
+    ('value', pa.float64()),
+])
+PARTITION_COLUMNS = ('metric_id', 'entity_id', 'metric_periodicity', 'country_name')
+
+
+def read_series_file(path):
+    with open(path, newline='') as f:
+        for row in csv.DictReader(f):
+            yield (row['metric_id'], row['entity_id'], row['metric_periodicity'].title(),
+                   row.get('country_name') or '')
+
+
+def iter_responses(client, series, window=64):
+    for key, json_response in client.imap_unordered(client.time_series, series, window):
+        if isinstance(json_response, AkmApiError):
+            print('Skipping %s: %s' % (key, json_response))
+        else:
+            yield key, json_response
+
+
+class BatchBuilder:
+
+    def __init__(self, date_field='date', value_field='value'):
+        self.date_field = date_field
+        self.value_field = value_field
+        self._reset()
+
+    def _reset(self):
+        self.columns = {name: [] for name in SCHEMA.names}
+
+    def __len__(self):
+        return len(self.columns['date'])
+
+    def add(self, key, rows):
+        metric_id, entity_id, metric_periodicity, country_name = key
+        for r in rows:
+            value = r.get(self.value_field)
+            self.columns['metric_id'].append(metric_id)
+            self.columns['entity_id'].append(entity_id)
+            self.columns['metric_periodicity'].append(metric_periodicity)
+            self.columns['country_name'].append(country_name)
+            self.columns['date'].append(date.fromisoformat(str(r[self.date_field])[:10]))
+            self.columns['value'].append(None if value is None else float(value))
+
+    def flush(self):
+        batch = pa.RecordBatch.from_arrays([pa.array(self.columns[f.name], type=f.type) for f in SCHEMA],
+                                           schema=SCHEMA)
+        self._reset()
+        return batch
+
+
+def iter_batches(responses, batch_rows=100000, date_field='date', value_field='value'):
+    builder = BatchBuilder(date_field, value_field)
+    for key, json_response in responses:
+        builder.add(key, json_response['data'])
+        if len(builder) >= batch_rows:
+            with tracing.span('export.build_batch', rows=len(builder)):
+                batch = builder.flush()
+            yield batch
+    if len(builder):
+        with tracing.span('export.build_batch', rows=len(builder)):
+            batch = builder.flush()
+        yield batch
+
+
+def export_time_series(client, series, output_dir, file_format='parquet', partition_by=('metric_periodicity',),
+                       batch_rows=100000, window=64, date_field='date', value_field='value'):
+    batches = iter_batches(iter_responses(client, series, window), batch_rows, date_field, value_field)
+    with tracing.span('export.write_dataset', output_dir=output_dir, format=file_format):
+        ds.write_dataset(
+            batches,
+            output_dir,
+            schema=SCHEMA,
+            format='ipc' if file_format == 'arrow' else file_format,
+            partitioning=list(partition_by) or None,
+            partitioning_flavor='hive',
+            existing_data_behavior='error',
+            max_partitions=batch_rows,
+            max_rows_per_group=batch_rows,
+            basename_template='part-{i}.' + file_format,
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export AKM time series to partitioned Parquet/Arrow files.')
+    parser.add_argument('series_file', help='CSV of metric_id,entity_id,metric_periodicity,country_name')
+    parser.add_argument('output_dir')
+    parser.add_argument('--format', choices=['parquet', 'arrow'], default='parquet')
+    parser.add_argument('--partition-by', nargs='*', choices=PARTITION_COLUMNS, default=['metric_periodicity'],
+                        help='columns used for hive-style partition directories')
+    parser.add_argument('--batch-rows', type=int, default=100000, help='rows per record batch / row group')
+    parser.add_argument('--window', type=int, default=64, help='max responses held in memory at once')
+    parser.add_argument('--concurrency', type=int, default=16, help='max in-flight requests')
+    parser.add_argument('--domain', default=DOMAIN)
+    parser.add_argument('--client-id', default=os.environ.get('AKM_CLIENT_ID', ''))
+    parser.add_argument('--client-secret', default=os.environ.get('AKM_CLIENT_SECRET', ''))
+    args = parser.parse_args()
+    if os.path.isdir(args.output_dir) and os.listdir(args.output_dir):
+        parser.error('%s is not empty; export into a new directory' % args.output_dir)
+
+    with AkmClient(domain=args.domain, max_concurrency=args.concurrency) as client:
+        try:
+            client.authenticate(args.client_id, args.client_secret)
+        except AkmApiError:
+            print('Cannot get token with given client id and secret. Aborting......')
+            exit(1)
+        export_time_series(client, read_series_file(args.series_file), args.output_dir, args.format,
+                           args.partition_by, args.batch_rows, args.window)
+
+
+if __name__ == '__main__':
+    main()
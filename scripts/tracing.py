@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+
+# Timing spans, counters and histograms for the AKM scripts (set TRACE_FILE).
+# The implementation is aws_marketplace/marketplace_tools/tracing.py, which
+# needs only the standard library. It is loaded here from its file path, so
+# the scripts share it without putting aws_marketplace on sys.path, and
+# `import tracing` gives that module itself.
+#
+# Examples:
+#   TRACE_FILE=/tmp/akm_trace.jl python akm_sync.py akm_store.sqlite --forecasts forecasts.csv
+#   python tracing.py /tmp/akm_trace.jl
+
+import importlib.util
+import os
+import sys
+
+TRACING_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'aws_marketplace',
+                            'marketplace_tools', 'tracing.py')
+
+
+def _load(name):
+    spec = importlib.util.spec_from_file_location(name, TRACING_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+if __name__ == '__main__':
+    _load('marketplace_tools_tracing').main()
+else:
+    sys.modules[__name__] = _load(__name__)